@@ -1,12 +1,6 @@
 #!/bin/sh
 set -e
 
-python manage.py collectstatic --no-input
+python manage.py bootstrap
 
-python manage.py makemigrations
-
-python manage.py migrate
-
-python manage.py load_csv
-
-gunicorn foodgram.wsgi:application --bind 0:8000
+exec gunicorn --config gunicorn.conf.py
@@ -0,0 +1,39 @@
+"""Асинхронные представления для запуска под ASGI (uvicorn).
+
+ORM и DRF в Django 3.2 синхронные, а синхронные представления под ASGI
+выполняются в одном общем потоке, поэтому медленный запрос задерживает
+все остальные. Здесь чтение (GET) выполняется в пуле потоков
+(thread_sensitive=False) и не ждет других запросов, а запись остается
+в общем потоке, как у обычных синхронных представлений."""
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def run_view(view, request, *args, **kwargs):
+    """Вызывает синхронное представление DRF и рендерит ответ в том же
+    потоке. Соединение с БД, открытое в потоке пула, закрывается по
+    правилам CONN_MAX_AGE."""
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(viewset, actions, read_methods=('get', 'head')):
+    """Возвращает асинхронное представление для viewset.as_view(actions)."""
+    view = viewset.as_view(actions)
+    run_read = sync_to_async(run_view, thread_sensitive=False)
+    run_write = sync_to_async(run_view)
+
+    async def wrapper(request, *args, **kwargs):
+        if request.method.lower() in read_methods:
+            return await run_read(view, request, *args, **kwargs)
+        return await run_write(view, request, *args, **kwargs)
+
+    wrapper.csrf_exempt = True
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
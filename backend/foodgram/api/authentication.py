@@ -0,0 +1,44 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_KEY = 'auth:token:{digest}'
+
+
+def get_cache():
+    return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+
+def token_cache_key(key):
+    """Ключ кэша для токена. Сам токен в кэш не попадает."""
+    return TOKEN_KEY.format(digest=sha256(key.encode()).hexdigest())
+
+
+def forget_token(key):
+    """Удаляет токен из кэша (выход, удаление или изменение пользователя)."""
+    get_cache().delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который кэширует токен вместе с пользователем
+    на AUTH_TOKEN_CACHE_TIMEOUT секунд, чтобы не обращаться к БД
+    на каждом запросе. Запись удаляется при удалении токена (logout)
+    и при сохранении пользователя (в том числе деактивации).
+    Подключается настройкой AUTH_TOKEN_CACHE: по умолчанию только
+    при общем для всех воркеров кэше."""
+
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            return user, token
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.')
+        return token.user, token
@@ -0,0 +1,84 @@
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+LAST_MODIFIED_KEY = 'catalog:{label}:last_modified'
+RESPONSE_KEY = 'catalog:{label}:{version}:{path}'
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_last_modified(model):
+    """Время последнего изменения справочника. Оно же служит версией
+    ключей кэша: после изменения модели старые ответы не используются.
+    Версия живет не дольше ответов: воркер, до кэша которого не дошел
+    сброс, через CATALOG_CACHE_TIMEOUT начинает новую версию."""
+    cache = get_cache()
+    key = LAST_MODIFIED_KEY.format(label=model._meta.label_lower)
+    if cache.get(key) is None:
+        cache.add(key, time.time(), settings.CATALOG_CACHE_TIMEOUT)
+    return cache.get(key, time.time())
+
+
+def touch(model):
+    """Сбрасывает кэш справочника после изменения модели."""
+    get_cache().set(
+        LAST_MODIFIED_KEY.format(label=model._meta.label_lower),
+        time.time(),
+        settings.CATALOG_CACHE_TIMEOUT)
+
+
+class CatalogCacheMixin:
+    """Кэширование ответов list и retrieve для редко меняющихся
+    справочников (теги, ингредиенты). Отдает заголовки ETag,
+    Last-Modified и Cache-Control и отвечает 304 на условные запросы."""
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, view, request, *args, **kwargs):
+        model = self.queryset.model
+        last_modified = get_last_modified(model)
+        key = RESPONSE_KEY.format(
+            label=model._meta.label_lower,
+            version=last_modified,
+            path=md5(request.get_full_path().encode()).hexdigest())
+        etag = f'"{md5(key.encode()).hexdigest()}"'
+        if self.is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache = get_cache()
+            data = cache.get(key)
+            if data is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                data = response.data
+                cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+            response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(
+            response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)
+        return response
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in if_none_match or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(
+            request.headers.get('If-Modified-Since'))
+        return (if_modified_since is not None
+                and int(last_modified) <= if_modified_since)
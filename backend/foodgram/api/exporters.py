@@ -0,0 +1,41 @@
+import csv
+from html import escape
+
+SHOPPING_CART_FILENAME = 'shopping_cart'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: вместо записи возвращает строку,
+    чтобы её можно было сразу отдать в StreamingHttpResponse."""
+
+    def write(self, value):
+        return value
+
+
+def txt_lines(ingredients):
+    for name, measurement_unit, amount in ingredients:
+        yield f'{name}, {amount} {measurement_unit.lower()}\n'
+
+
+def csv_lines(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for name, measurement_unit, amount in ingredients:
+        yield writer.writerow((name, amount, measurement_unit.lower()))
+
+
+def html_lines(ingredients):
+    yield ('<!DOCTYPE html>\n<html lang="ru">\n<head><meta charset="utf-8">'
+           '<title>Список покупок</title></head>\n<body>\n'
+           '<h1>Список покупок</h1>\n<ul>\n')
+    for name, measurement_unit, amount in ingredients:
+        yield (f'<li>{escape(name)}, {amount} '
+               f'{escape(measurement_unit.lower())}</li>\n')
+    yield '</ul>\n</body>\n</html>\n'
+
+
+EXPORTERS = {
+    'txt': ('text/plain; charset=utf-8', txt_lines),
+    'csv': ('text/csv; charset=utf-8', csv_lines),
+    'html': ('text/html; charset=utf-8', html_lines),
+}
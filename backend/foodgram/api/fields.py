@@ -0,0 +1,50 @@
+import base64
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from drf_base64.fields import Base64ImageField
+from rest_framework import serializers
+
+DECODE_CHUNK_SIZE = 64 * 1024
+
+
+class RecipeImageField(Base64ImageField):
+    """Base64ImageField, который проверяет размер картинки до
+    декодирования и декодирует ее по частям во временный файл
+    (в памяти до 1 Мб, дальше на диске), не создавая полную копию
+    данных в памяти."""
+
+    def _decode(self, data):
+        if not (isinstance(data, str) and data.startswith('data:')):
+            return super()._decode(data)
+        start = data.find(';base64,')
+        if start == -1:
+            raise serializers.ValidationError('Некорректный формат картинки.')
+        extension = data[data.find('/') + 1:start]
+        start += len(';base64,')
+        size = (len(data) - start) * 3 // 4
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Размер картинки не должен превышать '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} Мб.')
+        file = SpooledTemporaryFile(max_size=1024 * 1024)
+        # Данные бывают разбиты на строки (base64.encodebytes), поэтому
+        # пробельные символы убираются, а хвост куска, не кратный 4,
+        # переносится в следующий кусок.
+        rest = ''
+        try:
+            for offset in range(start, len(data), DECODE_CHUNK_SIZE):
+                chunk = rest + ''.join(
+                    data[offset:offset + DECODE_CHUNK_SIZE].split())
+                end = len(chunk) - len(chunk) % 4
+                file.write(base64.b64decode(chunk[:end]))
+                rest = chunk[end:]
+            file.write(base64.b64decode(rest))
+        except (binascii.Error, ValueError):
+            file.close()
+            raise serializers.ValidationError('Некорректный формат картинки.')
+        file.seek(0)
+        return File(file, name=f'{uuid.uuid4()}.{extension}')
@@ -1,12 +1,27 @@
-from django_filters.rest_framework import (CharFilter, ChoiceFilter, FilterSet,
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connections
+from django.db.models import (Case, Exists, F, FloatField, OuterRef, Q, Value,
+                              When)
+from django_filters.rest_framework import (BaseInFilter, CharFilter,
+                                           ChoiceFilter, FilterSet,
                                            ModelChoiceFilter,
-                                           ModelMultipleChoiceFilter)
-from recipes.models import Ingredient, Recipe, Tag
+                                           ModelMultipleChoiceFilter,
+                                           NumberFilter)
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            Shopping, Tag)
 from users.models import User
 
 
+class NumberInFilter(BaseInFilter, NumberFilter):
+    """Список чисел через запятую."""
+
+
 class RecipesFilter(FilterSet):
-    """Фильтрация по избранному, автору, списку покупок и тегам."""
+    """Фильтрация по избранному, автору, списку покупок, тегам
+    и ингредиентам. Поиск по названию рецепта (search) с ранжированием
+    по похожести, полнотекстовый поиск по названию и описанию (q)
+    и сортировка по популярности (ordering=popular)."""
     is_favorited = ChoiceFilter(
         choices=((1, '1'), (0, '0')),
         method='is_favorited_method'
@@ -24,22 +39,92 @@ class RecipesFilter(FilterSet):
         to_field_name='slug',
         queryset=Tag.objects.all()
     )
+    search = CharFilter(method='search_method')
+    q = CharFilter(method='full_text_search_method')
+    ingredients = NumberInFilter(method='ingredients_method')
+    ordering = ChoiceFilter(
+        choices=(('popular', 'popular'), ('new', 'new')),
+        method='ordering_method'
+    )
 
     def is_favorited_method(self, queryset, name, value):
-        return self.filter(queryset, value, self.request.user.favorites)
+        return self.filter(queryset, value, Favorite.objects.filter(
+            user_id=self.request.user.id))
 
     def is_in_shopping_cart_method(self, queryset, name, value):
-        return self.filter(queryset, value, self.request.user.shoppings)
+        return self.filter(queryset, value, Shopping.objects.filter(
+            user_id=self.request.user.id))
 
     def filter(self, queryset, value, collection):
-        data = collection.values_list('recipe', flat=True)
+        """Полусоединение через EXISTS вместо IN (подзапрос) и NOT IN."""
+        if self.request.user.is_anonymous:
+            return queryset.none() if int(value) else queryset
+        exists = Exists(collection.filter(recipe=OuterRef('pk')))
         if int(value):
-            return queryset.filter(id__in=data)
-        return queryset.exclude(id__in=data)
+            return queryset.filter(exists)
+        return queryset.filter(~exists)
+
+    def search_method(self, queryset, name, value):
+        """На PostgreSQL icontains использует trigram-индекс по
+        UPPER(name), а результаты упорядочиваются по TrigramSimilarity.
+        На других СУБД совпадения в начале названия идут первыми."""
+        queryset = queryset.filter(name__icontains=value)
+        if connections[queryset.db].vendor == 'postgresql':
+            similarity = TrigramSimilarity('name', value)
+        else:
+            similarity = Case(
+                When(name__istartswith=value, then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField())
+        return queryset.annotate(
+            similarity=similarity
+        ).order_by('-similarity', '-pub_date')
+
+    def full_text_search_method(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию рецепта.
+        На PostgreSQL запрос (синтаксис websearch, русская морфология)
+        сопоставляется с search_vector по GIN-индексу, результаты
+        упорядочиваются по ts_rank: совпадения в названии весят больше.
+        На других СУБД каждое слово ищется через icontains, выше те
+        рецепты, в названии которых больше слов запроса."""
+        if connections[queryset.db].vendor == 'postgresql':
+            query = SearchQuery(value, config='russian',
+                                search_type='websearch')
+            return queryset.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query)
+            ).order_by('-rank', '-pub_date')
+        words = value.split()
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(text__icontains=word))
+        rank = sum(
+            (Case(When(name__icontains=word, then=Value(1.0)),
+                  default=Value(0.0),
+                  output_field=FloatField())
+             for word in words),
+            Value(0.0))
+        return queryset.annotate(rank=rank).order_by('-rank', '-pub_date')
+
+    def ingredients_method(self, queryset, name, value):
+        """Рецепты, в которых есть все перечисленные ингредиенты
+        (?ingredients=1,2). Каждое условие — EXISTS по уникальному
+        индексу IngredientAmount (recipe, ingredient)."""
+        for ingredient_id in set(value):
+            queryset = queryset.filter(Exists(IngredientAmount.objects.filter(
+                recipe=OuterRef('pk'), ingredient_id=ingredient_id)))
+        return queryset
+
+    def ordering_method(self, queryset, name, value):
+        """Сортировка по популярности использует индекс
+        по (-favorites_count, -pub_date)."""
+        if value == 'popular':
+            return queryset.order_by('-favorites_count', '-pub_date')
+        return queryset.order_by('-pub_date')
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'author', 'is_in_shopping_cart', 'tags']
+        fields = ['is_favorited', 'author', 'is_in_shopping_cart', 'tags',
+                  'search', 'q', 'ingredients', 'ordering']
 
 
 class IngredientsFilter(FilterSet):
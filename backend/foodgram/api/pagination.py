@@ -1,6 +1,88 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+def estimate_count(queryset):
+    """Приблизительное число объектов. Для queryset без фильтров
+    на PostgreSQL берется из статистики pg_class.reltuples, в остальных
+    случаях точный COUNT кэшируется на COUNT_CACHE_TIMEOUT секунд.
+    Для заведомо пустого queryset (none()) возвращает 0."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is not None and row[0] >= 0:
+            return row[0]
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    key = f'count:{md5(sql.encode()).hexdigest()}'
+    return cache.get_or_set(
+        key, queryset.count, settings.COUNT_CACHE_TIMEOUT)
+
+
+class CustomCursorPagination(CursorPagination):
+    """Курсорная (keyset) пагинация без COUNT и OFFSET.
+    Порядок задает метод get_cursor_ordering вьюсета.
+    Общее число объектов возвращается только по запросу:
+    count=exact (COUNT) или count=estimate (estimate_count)."""
+    page_size = 6
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(view.get_cursor_ordering())
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            self.count = queryset.count()
+        elif mode == 'estimate':
+            self.count = estimate_count(queryset)
+        else:
+            self.count = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+
+class CursorPaginationMixin:
+    """Включает курсорную пагинацию, если в запросе есть параметр cursor
+    (для первой страницы — пустой), иначе используется pagination_class.
+    Порядок страниц — cursor_ordering; вьюсет, который сортирует
+    по параметрам запроса, переопределяет get_cursor_ordering."""
+    cursor_pagination_class = CustomCursorPagination
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, '_paginator')
+                and self.cursor_pagination_class.cursor_query_param
+                in self.request.query_params):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
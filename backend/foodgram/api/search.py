@@ -0,0 +1,61 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    """Приводит строку к виду для сравнения без учета регистра,
+    в том числе для кириллицы (ё и е считаются одной буквой)."""
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса
+    для автодополнения. Загружается при первом обращении и сбрасывается
+    сигналом при изменении модели Ingredient."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._entries = None
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries = None
+
+    def load(self):
+        entries = self._entries
+        if entries is not None:
+            return entries
+        with self._lock:
+            generation = self._generation
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (normalize(ingredient.name), ingredient.id))
+        entries = ([normalize(ingredient.name) for ingredient in ingredients],
+                   ingredients)
+        with self._lock:
+            if generation == self._generation:
+                self._entries = entries
+        return entries
+
+    def search(self, query):
+        """Ингредиенты, название которых начинается с query, а за ними
+        ингредиенты, содержащие query в середине названия."""
+        names, ingredients = self.load()
+        query = normalize(query)
+        start = bisect_left(names, query)
+        end = start
+        while end < len(names) and names[end].startswith(query):
+            end += 1
+        contains = [
+            ingredient
+            for name, ingredient in zip(names, ingredients)
+            if query in name and not name.startswith(query)
+        ]
+        return ingredients[start:end] + contains
+
+
+ingredient_index = IngredientIndex()
@@ -1,7 +1,12 @@
+from api.fields import RecipeImageField
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
-from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from recipes.models import (ImageStatus, Ingredient, IngredientAmount, Recipe,
+                            Shopping, Tag)
+from recipes.shopping_list import change_recipe
 from rest_framework import serializers
 from users.models import User
 
@@ -19,6 +24,8 @@ class UserReadSerializer(UserSerializer):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         return user.follower.filter(author=author).exists()
 
 
@@ -34,7 +41,7 @@ class SubscriptionSerializer(UserReadSerializer):
     """Сериализатор модели User.
     Используется при добавлении подписок и просмотре страницы подписок."""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -42,22 +49,19 @@ class SubscriptionSerializer(UserReadSerializer):
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, author):
-        recipes = Recipe.objects.filter(author=author)
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        if recipes:
+        if hasattr(author, 'preview_recipes'):
+            recipes = author.preview_recipes
+        else:
+            recipes = Recipe.objects.filter(author=author)
+            limit = self.context['request'].GET.get('recipes_limit')
             if limit:
                 recipes = recipes[: int(limit)]
-            serializer = FavoriteShoppingSerializer(
-                recipes,
-                context={'request': self.context.get('request')},
-                many=True
-            )
-            return serializer.data
-        return Recipe.objects.none()
-
-    def get_recipes_count(self, author):
-        return Recipe.objects.filter(author=author).count()
+        serializer = FavoriteShoppingSerializer(
+            recipes,
+            context={'request': self.context.get('request')},
+            many=True
+        )
+        return serializer.data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -118,23 +122,38 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     author = UserReadSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'thumbnails',
+                  'text', 'cooking_time')
         model = Recipe
 
+    def get_thumbnails(self, recipe):
+        """Ссылки на уменьшенные копии картинки по ширине. Пока картинка
+        не обработана командой process_images, словарь пустой."""
+        request = self.context['request']
+        return {
+            width: request.build_absolute_uri(default_storage.url(name))
+            for width, name in recipe.thumbnails.items()
+        }
+
     def get_is_favorited(self, recipe):
-        return self.get_parameter_value(recipe, 'favorites')
+        return self.get_parameter_value(recipe, 'is_favorited', 'favorites')
 
     def get_is_in_shopping_cart(self, recipe):
-        return self.get_parameter_value(recipe, 'shoppings')
+        return self.get_parameter_value(
+            recipe, 'is_in_shopping_cart', 'shoppings')
 
-    def get_parameter_value(self, recipe, collection_name):
+    def get_parameter_value(self, recipe, annotation, collection_name):
+        """Значение берется из аннотации queryset вьюсета, если она есть,
+        иначе вычисляется отдельным запросом."""
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(recipe, annotation):
+            return getattr(recipe, annotation)
         return getattr(user, collection_name).filter(recipe=recipe).exists()
 
 
@@ -147,7 +166,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = IngredientRecipeWriteSerializer(
         many=True)
     author = UserReadSerializer(read_only=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         fields = ('id', 'tags', 'author', 'ingredients',
@@ -160,15 +179,50 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise ValidationError(
                 'Нельзя добавлять ингредиент более одного раза.'
             )
+        missing = ingredients_set - Ingredient.objects.in_bulk(
+            ingredients_set).keys()
+        if missing:
+            raise ValidationError(
+                'Ингредиенты не найдены: '
+                f'{", ".join(str(id) for id in sorted(missing))}.'
+            )
         return ingredients
 
     def create_ingredient_amount(self, ingredients, recipe):
-        for ingredient in ingredients:
-            IngredientAmount.objects.create(
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
                 recipe=recipe,
                 ingredient_id=ingredient['id'],
                 amount=ingredient['amount'])
-
+            for ingredient in ingredients)
+
+    def update_ingredient_amount(self, ingredients, recipe):
+        """Сравнивает новый состав рецепта с сохраненным и изменяет
+        только отличающиеся строки IngredientAmount.
+        Возвращает изменение количества по ингредиентам."""
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        deltas = dict(amounts)
+        changed = []
+        deleted = []
+        for ingredient_amount in recipe.ingredientamount_set.all():
+            ingredient_id = ingredient_amount.ingredient_id
+            amount = amounts.pop(ingredient_id, None)
+            deltas[ingredient_id] = (amount or 0) - ingredient_amount.amount
+            if amount is None:
+                deleted.append(ingredient_amount.id)
+            elif amount != ingredient_amount.amount:
+                ingredient_amount.amount = amount
+                changed.append(ingredient_amount)
+        if deleted:
+            IngredientAmount.objects.filter(id__in=deleted).delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+        self.create_ingredient_amount(
+            [{'id': id, 'amount': amount} for id, amount in amounts.items()],
+            recipe)
+        return deltas
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -177,12 +231,15 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         ingredients = validated_data.pop('ingredients')
-        recipe.ingredients.clear()
         tags = validated_data.pop('tags')
-        recipe.tags.clear()
-        self.create_ingredient_amount(ingredients, recipe)
+        if 'image' in validated_data:
+            validated_data['image_status'] = ImageStatus.PENDING
+            validated_data['thumbnails'] = {}
+        change_recipe(recipe,
+                      self.update_ingredient_amount(ingredients, recipe))
         recipe.tags.set(tags)
         return super().update(recipe, validated_data)
 
@@ -198,3 +255,29 @@ class FavoriteShoppingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
+
+
+class ShoppingCartSerializer(serializers.ModelSerializer):
+    """Сериализатор модели Shopping: множитель порций рецепта
+    в списке покупок."""
+    class Meta:
+        model = Shopping
+        fields = ('servings',)
+
+
+class ShoppingCartServingsSerializer(ShoppingCartSerializer):
+    """Изменение множителя порций: servings обязателен."""
+    class Meta(ShoppingCartSerializer.Meta):
+        extra_kwargs = {'servings': {'required': True}}
+
+
+class BatchSerializer(serializers.Serializer):
+    """Список id для пакетного добавления или удаления избранного,
+    покупок и подписок."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE)
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
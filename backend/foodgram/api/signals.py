@@ -0,0 +1,57 @@
+from api.authentication import forget_token
+from api.cache import touch
+from api.search import ingredient_index
+from django.core.signals import request_started
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from recipes import shopping_list
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_catalog_cache(sender, **kwargs):
+    touch(sender)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """Вычитает рецепт из списков покупок до удаления, пока строки
+    Shopping еще есть: при удалении через API, админку и каскадом
+    вместе с автором."""
+    shopping_list.remove_recipe(instance)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver((post_save, post_delete), sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    """Пользователь в кэше токенов устаревает при любом изменении,
+    в том числе при деактивации."""
+    for key in Token.objects.filter(user=instance.pk).values_list(
+            'key', flat=True):
+        forget_token(key)
+
+
+@receiver(request_started)
+def check_database_connections(**kwargs):
+    """Закрывает переиспользуемые соединения, которые перестали отвечать
+    (перезапуск PostgreSQL, разрыв сети), чтобы запрос открыл новое.
+    Включается ключом CONN_HEALTH_CHECKS в настройках базы."""
+    for connection in connections.all():
+        if (connection.settings_dict.get('CONN_HEALTH_CHECKS')
+                and connection.connection is not None
+                and not connection.in_atomic_block
+                and not connection.is_usable()):
+            connection.close()
@@ -0,0 +1,237 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+import threading
+from unittest import skipUnless
+
+from api.fields import DECODE_CHUNK_SIZE, RecipeImageField
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from PIL import Image
+from recipes.models import Favorite, Ingredient, IngredientAmount, Recipe, Tag
+from rest_framework.test import APIClient, APITestCase
+from users.models import User
+
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChw'
+    'GA60e6kgAAAABJRU5ErkJggg==')
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        first_name='Иван', last_name='Иванов', password='password')
+
+
+def create_recipes(author, count):
+    """Рецепты автора с тремя тегами и пятью ингредиентами каждый."""
+    tags = [Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(3)]
+    ingredients = [Ingredient.objects.create(name=f'Продукт {i}',
+                                             measurement_unit='г')
+                   for i in range(5)]
+    image = Recipe._meta.get_field('image').storage.save(
+        'recipes/image.png', ContentFile(PNG))
+    recipes = []
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {i}', text='Текст',
+            cooking_time=10, image=image)
+        recipe.tags.set(tags)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient,
+                             amount=100)
+            for ingredient in ingredients)
+        recipes.append(recipe)
+    return recipes
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeQueriesTest(APITestCase):
+    """Число запросов к базе на чтение рецептов не зависит от числа
+    рецептов на странице."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        create_recipes(create_user('author'), 20)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        # COUNT, рецепты, теги, ингредиенты, авторы.
+        for limit in (6, 100):
+            with self.subTest(limit=limit), self.assertNumQueries(5):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), min(limit, 20))
+
+    def test_retrieve_queries(self):
+        recipe = Recipe.objects.first()
+        # Рецепт, теги, ингредиенты, автор.
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_write_queries_do_not_depend_on_ingredients(self):
+        # Теги проверяются по одному запросу, ингредиенты — одним.
+        # Ответ — повторное чтение рецепта теми же четырьмя запросами,
+        # что и retrieve.
+        tags = list(Tag.objects.values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        image = 'data:image/png;base64,' + base64.b64encode(PNG).decode()
+        for count in (1, 5):
+            ingredients = [{'id': pk, 'amount': 10}
+                           for pk in ingredient_ids[:count]]
+            data = {'tags': tags, 'ingredients': ingredients,
+                    'name': f'Новый рецепт {count}', 'text': 'Текст',
+                    'cooking_time': 5, 'image': image}
+            with self.subTest(ingredients=count):
+                with self.assertNumQueries(19):
+                    response = self.client.post(
+                        '/api/recipes/', data, format='json')
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data['ingredients']), count)
+                with self.assertNumQueries(16):
+                    response = self.client.patch(
+                        f"/api/recipes/{response.data['id']}/", data,
+                        format='json')
+                self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CursorPaginationTest(APITestCase):
+    """Число объектов при курсорной пагинации по запросу count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(create_user('author'), 3)
+
+    def test_count(self):
+        for mode in ('exact', 'estimate'):
+            with self.subTest(count=mode):
+                response = self.client.get(
+                    f'/api/recipes/?cursor=&count={mode}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['count'], 3)
+
+    def test_estimate_count_of_empty_queryset(self):
+        # Для анонима фильтр по избранному возвращает queryset.none().
+        response = self.client.get(
+            '/api/recipes/?is_favorited=1&cursor=&count=estimate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['results'], [])
+
+
+class RecipeImageFieldTest(SimpleTestCase):
+    """Картинка больше куска декодирования принимается и в одну
+    строку, и разбитой на строки по 76 символов."""
+
+    def test_decodes_line_wrapped_base64(self):
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (256, 256), os.urandom(256 * 256 * 3)).save(
+            buffer, 'PNG')
+        content = buffer.getvalue()
+        self.assertGreater(len(content), DECODE_CHUNK_SIZE)
+        for encoded in (base64.b64encode(content).decode(),
+                        base64.encodebytes(content).decode()):
+            with self.subTest(wrapped='\n' in encoded):
+                file = RecipeImageField().to_internal_value(
+                    'data:image/png;base64,' + encoded)
+                file.seek(0)
+                self.assertEqual(file.read(), content)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTest(SimpleTestCase):
+    """Одинаковое содержимое сохраняется в один файл независимо
+    от расширения, заявленного клиентом."""
+
+    def test_extension_follows_image_format(self):
+        storage = Recipe._meta.get_field('image').storage
+        names = {storage.save(f'recipes/image.{extension}', ContentFile(PNG))
+                 for extension in ('jpg', 'jpeg', 'PNG')}
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names.pop().endswith('.png'))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ConcurrentFavoriteTest(TransactionTestCase):
+    """Параллельные одинаковые запросы не нарушают уникальность
+    и не учитываются в счетчике дважды."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('In-memory SQLite locks tables for concurrent '
+                          'connections; set DB_TEST_NAME to a file.')
+
+    def test_parallel_favorite_posts(self):
+        user = create_user('reader')
+        recipe, = create_recipes(create_user('author'), 1)
+        barrier = threading.Barrier(2)
+        statuses = []
+
+        def post():
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                statuses.append(client.post(
+                    f'/api/recipes/{recipe.pk}/favorite/').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(statuses), [201, 400])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'EXPLAIN output is checked only on PostgreSQL.')
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class IndexUsageTest(TestCase):
+    """Горячие запросы фильтров и сортировки используют индексы.
+    На маленькой тестовой базе последовательное чтение дешевле,
+    поэтому оно отключается на время теста."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe, *_ = create_recipes(cls.author, 20)
+        Favorite.objects.create(user=create_user('reader'), recipe=cls.recipe)
+
+    def explain(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_feed_uses_pub_date_index(self):
+        self.assertIn('recipe_pub_date_idx', self.explain(
+            Recipe.objects.order_by('-pub_date')[:6]))
+
+    def test_author_page_uses_author_pub_date_index(self):
+        self.assertIn('recipe_author_pub_date_idx', self.explain(
+            Recipe.objects.filter(author=self.author).order_by(
+                '-pub_date')[:6]))
+
+    def test_recipe_favorites_use_recipe_user_index(self):
+        self.assertIn('favorite_recipe_user_idx', self.explain(
+            Favorite.objects.filter(recipe=self.recipe).values('user')))
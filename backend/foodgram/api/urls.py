@@ -1,4 +1,6 @@
+from api.async_views import async_view
 from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -8,8 +10,23 @@ v1_router.register(r'recipes', RecipeViewSet, basename='recipes')
 v1_router.register(r'tags', TagViewSet, basename='tags')
 v1_router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 
+async_urlpatterns = [
+    path('recipes/',
+         async_view(RecipeViewSet, {'get': 'list', 'post': 'create'}),
+         name='recipes-list'),
+    path('recipes/<int:pk>/',
+         async_view(RecipeViewSet, {'get': 'retrieve',
+                                    'put': 'update',
+                                    'patch': 'partial_update',
+                                    'delete': 'destroy'}),
+         name='recipes-detail'),
+    path('ingredients/',
+         async_view(IngredientViewSet, {'get': 'list', 'post': 'create'}),
+         name='ingredients-list'),
+]
 
 urlpatterns = [
+    *(async_urlpatterns if settings.ASYNC_VIEWS else ()),
     path('', include(v1_router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,58 +1,180 @@
-from collections import defaultdict
-
+from api.cache import CatalogCacheMixin
+from api.exporters import EXPORTERS, SHOPPING_CART_FILENAME
 from api.filters import IngredientsFilter, RecipesFilter
-from api.pagination import CustomPageNumberPagination
+from api.pagination import CursorPaginationMixin, CustomPageNumberPagination
 from api.permissions import IsAuthorOrAdmin
-from api.serializers import (FavoriteShoppingSerializer, IngredientSerializer,
-                             RecipeReadSerializer, RecipeWriteSerializer,
+from api.search import ingredient_index
+from api.serializers import (BatchSerializer, FavoriteShoppingSerializer,
+                             IngredientSerializer, RecipeReadSerializer,
+                             RecipeWriteSerializer, ShoppingCartSerializer,
+                             ShoppingCartServingsSerializer,
                              SubscriptionSerializer, TagSerializer)
-from django.http import FileResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import Favorite, Ingredient, Recipe, Shopping, Tag
+from recipes import shopping_list
+from recipes.counters import (add_relation, add_relations, decrement,
+                              remove_relation, remove_relations)
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            Shopping, Tag)
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from users.models import Subscription, User
 
 
-class TagViewSet(viewsets.ModelViewSet):
-    """Вьюсет для модели Tag."""
+def annotate_is_subscribed(queryset, user):
+    """Добавляет к queryset пользователей флаг is_subscribed
+    (подписан ли на них user) подзапросом Exists."""
+    if user.is_anonymous:
+        return queryset
+    return queryset.annotate(is_subscribed=Exists(
+        user.follower.filter(author=OuterRef('pk'))))
+
+
+def batch_response(model, field, counter, request, exclude=()):
+    """Пакетное добавление (POST) или удаление (DELETE) связей
+    пользователя с объектами из списка ids в одной транзакции.
+    Возвращает статус по каждому id; id из exclude получают статус
+    forbidden."""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    pks = [pk for pk in ids if pk not in exclude]
+    user = request.user
+    with transaction.atomic():
+        if request.method == 'POST':
+            statuses = add_relations(model, field, counter, user, pks)
+            if model is Shopping:
+                shopping_list.add_recipes(user.pk, {
+                    pk: 1 for pk in pks if statuses[pk] == 'created'})
+        else:
+            if model is Shopping:
+                servings = shopping_list.cart_servings(user.pk, pks)
+            statuses = remove_relations(model, field, counter, user, pks)
+            if model is Shopping:
+                shopping_list.remove_recipes(user.pk, servings)
+    return Response({'results': [
+        {'id': pk, 'status': statuses.get(pk, 'forbidden')} for pk in ids]})
+
+
+class TagViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    """Вьюсет для модели Tag. Ответы на чтение кэшируются."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     """Вьюсет для модели Ingredient.
-    Реализован поиск по частичному вхождению в начале названия ингредиента."""
+    Реализован поиск по частичному вхождению в начале названия ингредиента.
+    При включенном INGREDIENT_SEARCH_INDEX поиск выполняется по индексу
+    в памяти: сначала совпадения в начале названия, затем в середине.
+    Ответы на чтение кэшируются."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend, SearchFilter)
     filterset_class = IngredientsFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not (settings.INGREDIENT_SEARCH_INDEX and name):
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(self.search_in_index, request, name)
+
+    def search_in_index(self, request, name):
+        serializer = self.get_serializer(
+            ingredient_index.search(name), many=True)
+        return Response(serializer.data)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """Вьюсет для модели Recipe.
     Реализована фильтрация по избранному, автору, списку покупок и тегам.
     Доступны пользовательские действия по добавлению рецепта в избранное
     и удалению, добавлению рецепта в список покупок и удалению, скачиванию
-    списка покупок в файл shopping_cart.txt."""
+    списка покупок в файл shopping_cart (txt, csv или html)."""
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipesFilter
     permission_classes = (IsAuthorOrAdmin,)
     pagination_class = CustomPageNumberPagination
+    cursor_ordering = ('-pub_date', '-id')
+    popular_cursor_ordering = ('-favorites_count', '-pub_date', '-id')
+
+    def get_cursor_ordering(self):
+        """Курсор следует порядку, запрошенному в ordering. Для поиска
+        с ранжированием по релевансу (search, q) курсор не поддерживается:
+        позиция по дробному рангу неустойчива."""
+        params = self.request.query_params
+        if params.get('search') or params.get('q'):
+            raise ValidationError({
+                'cursor': 'Cursor pagination is not supported '
+                          'with search or q.'})
+        if params.get('ordering') == 'popular':
+            return self.popular_cursor_ordering
+        return self.cursor_ordering
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return self.get_read_queryset()
+        return super().get_queryset()
+
+    def get_read_queryset(self):
+        """Queryset для RecipeReadSerializer: загружает все, что читает
+        сериализатор, фиксированным числом запросов на страницу.
+        Флаги is_favorited и is_in_shopping_cart, а также is_subscribed
+        у автора вычисляются подзапросами Exists."""
+        user = self.request.user
+        queryset = Recipe.objects.all()
+        authors = User.objects.all()
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(
+                    user.favorites.filter(recipe=OuterRef('pk'))),
+                is_in_shopping_cart=Exists(
+                    user.shoppings.filter(recipe=OuterRef('pk'))))
+            authors = annotate_is_subscribed(authors, user)
+        return queryset.defer('search_vector').prefetch_related(
+            'tags',
+            Prefetch('ingredientamount_set',
+                     IngredientAmount.objects.select_related('ingredient')),
+            Prefetch('author', authors))
 
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        User.objects.filter(pk=self.request.user.pk).update(
+            recipes_count=F('recipes_count') + 1)
+        self.reload_for_response(serializer)
+
+    @transaction.atomic
+    def perform_destroy(self, recipe):
+        recipe.delete()
+        User.objects.filter(pk=recipe.author_id).update(
+            recipes_count=decrement('recipes_count'))
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self.reload_for_response(serializer)
+
+    def reload_for_response(self, serializer):
+        """Перечитывает сохраненный рецепт вместе со связанными объектами,
+        чтобы RecipeWriteSerializer.to_representation не делал запрос
+        на каждый вложенный ингредиент."""
+        serializer.instance = self.get_read_queryset().get(
+            pk=serializer.instance.pk)
 
     @action(
             methods=('post', 'delete'),
@@ -62,47 +184,100 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk):
         return self.add_or_delete_object(Favorite,
                                          request,
-                                         pk)
+                                         pk,
+                                         'favorites_count')
 
     @action(
-            methods=('post', 'delete'),
+            methods=('post', 'patch', 'delete'),
             detail=True,
             permission_classes=(IsAuthenticated,),
             )
     def shopping_cart(self, request, pk):
+        """Добавление рецепта в список покупок с множителем порций
+        servings (по умолчанию 1), изменение множителя (PATCH)
+        и удаление."""
+        if request.method == 'DELETE':
+            return self.add_or_delete_object(Shopping, request, pk,
+                                             'shopping_count')
+        serializer_class = (ShoppingCartServingsSerializer
+                            if request.method == 'PATCH'
+                            else ShoppingCartSerializer)
+        serializer = serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if request.method == 'PATCH':
+            return self.change_servings(request, pk,
+                                        serializer.validated_data['servings'])
         return self.add_or_delete_object(Shopping,
                                          request,
-                                         pk)
+                                         pk,
+                                         'shopping_count',
+                                         **serializer.validated_data)
 
-    def add_or_delete_object(self, model, request, pk):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        if self.request.method == 'POST':
-            if model.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                return Response({'errors': 'Object already exists'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            model.objects.create(user=user, recipe=recipe)
+    def change_servings(self, request, pk, servings):
+        user = request.user
+        with transaction.atomic():
+            current = shopping_list.cart_servings(user.pk, [pk])
+            if current:
+                Shopping.objects.filter(user=user, recipe_id=pk).update(
+                    servings=servings)
+                shopping_list.add_recipes(
+                    user.pk, {recipe_id: servings - previous
+                              for recipe_id, previous in current.items()})
+                return Response({'id': int(pk), 'servings': servings})
+        get_object_or_404(Recipe, id=pk)
+        return Response(
+            {'errors': 'Object not found or already deleted'},
+            status=status.HTTP_400_BAD_REQUEST)
+
+    def add_or_delete_object(self, model, request, pk, counter, **fields):
+        """Добавляет или удаляет связь пользователя с рецептом и
+        в той же транзакции изменяет счетчик рецепта counter.
+        Повторный запрос не создает дубликат и не меняет счетчик."""
+        user = request.user
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=pk)
+            with transaction.atomic():
+                if not add_relation(model, Recipe, recipe.pk, counter,
+                                    user=user, recipe=recipe, **fields):
+                    return Response({'errors': 'Object already exists'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                if model is Shopping:
+                    shopping_list.add_recipes(
+                        user.pk, {recipe.pk: fields.get('servings', 1)})
             serializer = FavoriteShoppingSerializer(
                 recipe, context={'request': request},)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if self.request.method == 'DELETE':
-            if not model.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                return Response(
-                    {'errors': 'Object not found or already deleted'},
-                    status=status.HTTP_400_BAD_REQUEST)
-            data = get_object_or_404(model, user=user, recipe=recipe)
-            data.delete()
-            return Response({'messages': 'Object deleted'},
-                            status=status.HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            if model is Shopping:
+                servings = shopping_list.cart_servings(user.pk, [pk])
+            if remove_relation(model, Recipe, pk, counter,
+                               user=user, recipe_id=pk):
+                if model is Shopping:
+                    shopping_list.remove_recipes(user.pk, servings)
+                return Response({'messages': 'Object deleted'},
+                                status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, id=pk)
         return Response(
-            {'errors': 'Unauthorized'},
-            status=status.HTTP_401_UNAUTHORIZED)
+            {'errors': 'Object not found or already deleted'},
+            status=status.HTTP_400_BAD_REQUEST)
+
+    @action(
+            methods=('post', 'delete'),
+            detail=False,
+            url_path='favorite',
+            permission_classes=(IsAuthenticated,),
+            )
+    def favorite_batch(self, request):
+        return batch_response(Favorite, 'recipe', 'favorites_count', request)
+
+    @action(
+            methods=('post', 'delete'),
+            detail=False,
+            url_path='shopping_cart',
+            permission_classes=(IsAuthenticated,),
+            )
+    def shopping_cart_batch(self, request):
+        return batch_response(Shopping, 'recipe', 'shopping_count', request)
 
     @action(
             methods=('get',),
@@ -110,28 +285,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthorOrAdmin,),
             )
     def download_shopping_cart(self, request):
-        shopping_cart = Shopping.objects.filter(user=self.request.user)
-        lines = []
-        goods = defaultdict(lambda: 0)
-        for item in shopping_cart:
-            for ingredientamount in item.recipe.ingredientamount_set.all():
-                goods[
-                    (ingredientamount.ingredient.name,
-                     ingredientamount.ingredient.measurement_unit)
-                     ] += ingredientamount.amount
-        for (name, measurement_unit), amount in goods.items():
-            line = (f'{name}, '
-                    f'{amount} '
-                    f'{measurement_unit.lower()}')
-            lines.append(line)
-        filename = 'shopping_cart.txt'
-        with open(filename, 'w') as file:
-            file.write('\n'.join(lines))
-        return FileResponse(
-            open(filename, 'rb'), as_attachment=True, filename=filename)
-
-
-class UserViewSet(UserViewSet):
+        file_type = request.query_params.get('type', 'txt')
+        if file_type not in EXPORTERS:
+            return Response(
+                {'errors': f'Unsupported file type: {file_type}'},
+                status=status.HTTP_400_BAD_REQUEST)
+        content_type, exporter = EXPORTERS[file_type]
+        ingredients = shopping_list.shopping_list_rows(request.user)
+        # Строки читаются из БД здесь, а не при отдаче тела: под ASGI
+        # потоковый ответ итерируется в event loop, где ORM недоступна.
+        # Строк не больше, чем ингредиентов в справочнике.
+        response = StreamingHttpResponse(
+            exporter(list(ingredients)), content_type=content_type)
+        response['Content-Disposition'] = (
+            'attachment; '
+            f'filename="{SHOPPING_CART_FILENAME}.{file_type}"')
+        return response
+
+
+class UserViewSet(CursorPaginationMixin, UserViewSet):
     """Вьюсет для модели User.
     Доступны пользовательские действия по добавлению подписки на автора
     и удалению, а также просмотра страницы подписок с рецептами авторов.
@@ -140,6 +312,11 @@ class UserViewSet(UserViewSet):
     queryset = User.objects.all()
     lookup_field = 'id'
     pagination_class = CustomPageNumberPagination
+    cursor_ordering = ('username', 'id')
+
+    def get_queryset(self):
+        return annotate_is_subscribed(super().get_queryset(),
+                                      self.request.user)
 
     @action(
             methods=('post', 'delete'),
@@ -147,39 +324,38 @@ class UserViewSet(UserViewSet):
             permission_classes=(IsAuthenticated,),
             )
     def subscribe(self, request, id):
-        user = self.request.user
-        author = get_object_or_404(User, pk=id)
-        if self.request.method == 'POST':
+        user = request.user
+        if request.method == 'POST':
+            author = get_object_or_404(User, pk=id)
             if user.id == author.id:
                 return Response(
                     {'errors': 'You cannot subscribe to yourself'},
                     status=status.HTTP_400_BAD_REQUEST)
-            if Subscription.objects.filter(
-                user=user,
-                author=author
-            ).exists():
+            if not add_relation(Subscription, User, author.pk,
+                                'followers_count', user=user, author=author):
                 return Response({'errors': 'Object already exists'},
                                 status=status.HTTP_400_BAD_REQUEST)
-            Subscription.objects.create(user=user, author=author)
             serializer = SubscriptionSerializer(
                 author, context={'request': request},)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if self.request.method == 'DELETE':
-            if not Subscription.objects.filter(
-                user=user,
-                author=author
-            ).exists():
-                return Response(
-                    {'errors': 'Object not found or already deleted'},
-                    status=status.HTTP_400_BAD_REQUEST)
-            subscription = get_object_or_404(
-                Subscription, user=user, author=author)
-            subscription.delete()
-            return Response({'messages': 'Object deleted'},
-                            status=status.HTTP_204_NO_CONTENT)
-        return Response(
-            {'errors': 'Unauthorized'},
-            status=status.HTTP_401_UNAUTHORIZED)
+        if not remove_relation(Subscription, User, id, 'followers_count',
+                               user=user, author_id=id):
+            get_object_or_404(User, pk=id)
+            return Response(
+                {'errors': 'Object not found or already deleted'},
+                status=status.HTTP_400_BAD_REQUEST)
+        return Response({'messages': 'Object deleted'},
+                        status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+            methods=('post', 'delete'),
+            detail=False,
+            url_path='subscribe',
+            permission_classes=(IsAuthenticated,),
+            )
+    def subscribe_batch(self, request):
+        return batch_response(Subscription, 'author', 'followers_count',
+                              request, exclude=(request.user.pk,))
 
     @action(
         detail=False,
@@ -187,9 +363,21 @@ class UserViewSet(UserViewSet):
         permission_classes=(IsAuthorOrAdmin,),
     )
     def subscriptions(self, request):
+        """Страница подписок. Превью рецептов (не более recipes_limit
+        на автора) загружается для всей страницы одним запросом."""
         user = self.request.user
         user_subscriptions = user.follower.values_list('author_id', flat=True)
-        queryset = User.objects.filter(id__in=user_subscriptions)
+        recipes = Recipe.objects.all()
+        limit = request.query_params.get('recipes_limit')
+        if limit:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:int(limit)]))
+        queryset = annotate_is_subscribed(
+            User.objects.filter(id__in=user_subscriptions), user
+        ).prefetch_related(
+            Prefetch('recipes', recipes, to_attr='preview_recipes'))
         paginated_queryset = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
             paginated_queryset, many=True, context={'request': request},)
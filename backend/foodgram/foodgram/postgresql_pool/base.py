@@ -0,0 +1,102 @@
+"""Бэкенд PostgreSQL с пулом соединений внутри процесса.
+
+Соединение, которое Django закрывает в конце запроса, возвращается
+в пул и выдается следующему запросу без нового TCP-подключения
+и аутентификации. Пул общий для всех потоков процесса; его размер
+задается ключом POOL_SIZE в настройках базы (по умолчанию — число
+потоков воркера gunicorn). Если все соединения заняты, поток ждет
+освобождения не дольше POOL_TIMEOUT секунд."""
+import threading
+
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from django.db.utils import OperationalError
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class ConnectionPool:
+    """ThreadedConnectionPool, который ждет свободное соединение
+    вместо ошибки PoolError."""
+
+    def __init__(self, size, timeout, health_checks, conn_params):
+        self.pool = ThreadedConnectionPool(0, size, **conn_params)
+        self.slots = threading.BoundedSemaphore(size)
+        self.timeout = timeout
+        self.health_checks = health_checks
+
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError('Database connection pool exhausted')
+        try:
+            connection = self.pool.getconn()
+            if self.health_checks and not self.is_usable(connection):
+                self.pool.putconn(connection, close=True)
+                connection = self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        return connection
+
+    def putconn(self, connection):
+        try:
+            self.pool.putconn(connection, close=bool(connection.closed))
+        finally:
+            self.slots.release()
+
+    @staticmethod
+    def is_usable(connection):
+        """Проверяет соединение запросом SELECT 1 в режиме autocommit:
+        соединение из пула (и только что открытое) должно остаться вне
+        транзакции, иначе Django не сможет переключить autocommit."""
+        autocommit = connection.autocommit
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.autocommit = autocommit
+        except psycopg2.Error:
+            return False
+        return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def get_pool(self, conn_params):
+        with self.pools_lock:
+            if self.alias not in self.pools:
+                self.pools[self.alias] = ConnectionPool(
+                    self.settings_dict.get('POOL_SIZE', 4),
+                    self.settings_dict.get('POOL_TIMEOUT', 30),
+                    self.settings_dict.get('CONN_HEALTH_CHECKS', False),
+                    conn_params)
+            return self.pools[self.alias]
+
+    @base.async_unsafe
+    def get_new_connection(self, conn_params):
+        connection = self.get_pool(conn_params).getconn()
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def close_pool(self):
+        """Закрывает все соединения пула процесса. Вызывается мастером
+        gunicorn перед fork, чтобы воркеры создали собственные пулы."""
+        with self.pools_lock:
+            pool = self.pools.pop(self.alias, None)
+        if pool is not None:
+            pool.pool.closeall()
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pools[self.alias].putconn(self.connection)
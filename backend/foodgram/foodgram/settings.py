@@ -78,6 +78,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+# Async views for recipe list/detail and ingredient search (api/async_views.py).
+# Set ASYNC_VIEWS=True in infra/.env: gunicorn.conf.py reads the same
+# variable and switches to the uvicorn worker.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default='False') == 'True'
 
 
 # Database
@@ -91,10 +97,92 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='bjhbVGHK**61jb'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Persistent connections: a connection is reused by requests of the
+        # same thread for up to CONN_MAX_AGE seconds. With health checks on,
+        # a reused connection is tested with SELECT 1 at the start of each
+        # request (api/signals.py; built into Django 4.1+).
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', default='True') == 'True',
+        # Transaction pooling in pgbouncer does not support server-side
+        # cursors used by QuerySet.iterator().
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_PGBOUNCER', default='False') == 'True',
+        # A file-based SQLite test database allows tests with concurrent
+        # connections; the in-memory default locks tables instead.
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME')},
+    }
+}
+
+# In-process connection pool (foodgram/postgresql_pool): connections
+# closed by Django at the end of a request are returned to a pool shared
+# by the threads of a worker. Sized to the gunicorn threads per worker,
+# so the server sees at most workers * threads connections.
+if os.getenv('DB_POOL', default='False') == 'True':
+    DATABASES['default'].update({
+        'ENGINE': 'foodgram.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'POOL_SIZE': int(os.getenv(
+            'DB_POOL_SIZE', default=os.getenv('GUNICORN_THREADS', default=2))),
+        'POOL_TIMEOUT': int(os.getenv('DB_POOL_TIMEOUT', default=30)),
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# LocMemCache is per-process: with several gunicorn workers use a shared
+# backend (memcached, redis, database) so that invalidation reaches all
+# of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
     }
 }
 
+# Whether all workers see the same cache (anything but the per-process
+# LocMemCache and the no-op DummyCache).
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Tag and ingredient responses (api/cache.py). Admin edits invalidate them
+# only in the cache they reach, so with a per-process cache the lifetime
+# is short: other workers serve stale catalog data for at most a minute.
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.getenv(
+    'CATALOG_CACHE_TIMEOUT', default=3600 if SHARED_CACHE else 60))
+CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', default=60))
+
+# Token -> user resolution cache (api/authentication.py). Logout and user
+# changes invalidate it only in the cache they reach, so with LocMemCache
+# other workers would accept a revoked token for up to
+# AUTH_TOKEN_CACHE_TIMEOUT seconds. It is therefore on by default only
+# with a shared cache; AUTH_TOKEN_CACHE=True forces it on (for a single
+# worker process).
+AUTH_TOKEN_CACHE = os.getenv(
+    'AUTH_TOKEN_CACHE', default=str(SHARED_CACHE)) == 'True'
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=60))
+
+# Maximum number of ids in one batch favorite/cart/subscribe request.
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', default=100))
+
+# Cache lifetime of exact counts used as estimates by cursor pagination.
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', default=60))
+
+# In-process ingredient name index for autocomplete (api/search.py).
+# Like LocMemCache it is invalidated only in the process that saved
+# the ingredient.
+INGREDIENT_SEARCH_INDEX = os.getenv(
+    'INGREDIENT_SEARCH_INDEX', default='False') == 'True'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -121,7 +209,9 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication'
+        if AUTH_TOKEN_CACHE
+        else 'rest_framework.authentication.TokenAuthentication',
     ],
 }
 
@@ -163,3 +253,14 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Recipe images: uploads larger than RECIPE_IMAGE_MAX_SIZE bytes are
+# rejected before decoding; thumbnails are made by `manage.py
+# process_images` in a pool of IMAGE_WORKERS processes.
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=10 * 1024 * 1024))
+RECIPE_THUMBNAIL_WIDTHS = (320, 640, 1280)
+RECIPE_THUMBNAIL_FORMAT = os.getenv('RECIPE_THUMBNAIL_FORMAT', default='WEBP')
+RECIPE_THUMBNAIL_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
@@ -0,0 +1,53 @@
+"""Настройки gunicorn для контейнера backend.
+
+Число воркеров и потоков считается от доступных процессу CPU и может
+быть задано переменными окружения GUNICORN_*. Приложение загружается
+до fork (preload), поэтому воркеры делят память мастера copy-on-write.
+Воркеры перезапускаются после max_requests запросов, чтобы утечки
+памяти не накапливались."""
+import os
+
+
+def cpu_count():
+    """Число CPU, доступных процессу (учитывает cpuset контейнера)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default='False') == 'True'
+
+bind = os.getenv('GUNICORN_BIND', default='0:8000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS',
+    default=min(cpu_count() * 2 + 1,
+                int(os.getenv('GUNICORN_MAX_WORKERS', default=8)))))
+threads = int(os.getenv('GUNICORN_THREADS', default=2))
+
+if ASYNC_VIEWS:
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+    worker_class = 'gthread' if threads > 1 else 'sync'
+
+preload_app = True
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', default=1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER',
+                                    default=max_requests // 10))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', default=30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', default=5))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def pre_fork(server, worker):
+    """Закрывает соединения с БД и пул, открытые мастером при загрузке
+    приложения, чтобы воркеры не унаследовали общий сокет."""
+    from django.db import connections
+    connections.close_all()
+    for connection in connections.all():
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.forms.models import BaseInlineFormSet
-from recipes.models import Favorite, Ingredient, Recipe, Shopping, Tag
+from recipes import shopping_list
+from recipes.counters import recount_related
+from recipes.models import (Favorite, ImageBlob, Ingredient, Recipe, Shopping,
+                            Tag)
 
 
 class RecipeIngredientInlineFormSet(BaseInlineFormSet):
@@ -26,22 +30,86 @@ class RecipeIngredientInline(admin.TabularInline):
     min_num = 1
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class CounterAdminMixin:
+    """Пересчитывает денормализованные счетчики после изменений через
+    админку: вьюсеты обновляют их сами, а здесь объекты создаются,
+    переносятся и удаляются в обход API.
+    counters — пары (поле связи, счетчик связанного объекта)."""
+    counters = ()
+
+    def recount(self, objs):
+        for field, counter in self.counters:
+            recount_related(self.model, field, counter, objs)
+
+    def save_model(self, request, obj, form, change):
+        previous = (self.model.objects.filter(pk=obj.pk).first()
+                    if change else None)
+        super().save_model(request, obj, form, change)
+        self.recount([obj, previous] if previous else [obj])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recount([obj])
+
+    def delete_queryset(self, request, queryset):
+        objs = list(queryset)
+        super().delete_queryset(request, queryset)
+        self.recount(objs)
+
+
+class RecipeAdmin(CounterAdminMixin, admin.ModelAdmin):
+    counters = (('author', 'recipes_count'),)
     inlines = (RecipeIngredientInline,)
-    list_display = ('name', 'author', 'favorite')
+    list_display = ('name', 'author', 'favorites_count')
     list_filter = ('author', 'name', 'tags')
 
-    def favorite(self, recipe):
-        return recipe.favorite.count()
-
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
     list_filter = ('name',)
 
 
+class FavoriteAdmin(CounterAdminMixin, admin.ModelAdmin):
+    counters = (('recipe', 'favorites_count'),)
+
+
+class ShoppingAdmin(CounterAdminMixin, admin.ModelAdmin):
+    """Вместе со счетчиком обновляет готовые списки покупок
+    пользователей, чьи корзины изменены через админку."""
+    counters = (('recipe', 'shopping_count'),)
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        previous = (Shopping.objects.filter(pk=obj.pk).first()
+                    if change else None)
+        super().save_model(request, obj, form, change)
+        if previous:
+            shopping_list.remove_recipes(
+                previous.user_id, {previous.recipe_id: previous.servings})
+        shopping_list.add_recipes(obj.user_id, {obj.recipe_id: obj.servings})
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        shopping_list.remove_recipes(obj.user_id,
+                                     {obj.recipe_id: obj.servings})
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        objs = list(queryset)
+        super().delete_queryset(request, queryset)
+        for obj in objs:
+            shopping_list.remove_recipes(obj.user_id,
+                                         {obj.recipe_id: obj.servings})
+
+
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'references')
+
+
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Tag)
 admin.site.register(Ingredient, IngredientAdmin)
-admin.site.register(Favorite)
-admin.site.register(Shopping)
+admin.site.register(Favorite, FavoriteAdmin)
+admin.site.register(Shopping, ShoppingAdmin)
+admin.site.register(ImageBlob, ImageBlobAdmin)
@@ -0,0 +1,162 @@
+from django.db import connections, router, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from recipes.models import Favorite, Recipe, Shopping
+from users.models import Subscription, User
+
+
+def count_subquery(model, field):
+    """Подзапрос с числом строк model, ссылающихся полем field
+    на строку внешнего запроса."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count'),
+            output_field=IntegerField()),
+        0)
+
+
+def reconcile_counters():
+    """Пересчитывает денормализованные счетчики рецептов и пользователей
+    двумя запросами UPDATE."""
+    recipes = Recipe.objects.update(
+        favorites_count=count_subquery(Favorite, 'recipe'),
+        shopping_count=count_subquery(Shopping, 'recipe'))
+    users = User.objects.update(
+        recipes_count=count_subquery(Recipe, 'author'),
+        followers_count=count_subquery(Subscription, 'author'))
+    return recipes, users
+
+
+def decrement(counter, value=1):
+    """Выражение для уменьшения счетчика, не опускающееся ниже нуля:
+    связь могла быть создана в обход счетчиков (админка, shell)."""
+    return Greatest(F(counter) - value, 0)
+
+
+def recount_related(model, field, counter, objs):
+    """Пересчитывает счетчики объектов, на которые ссылаются
+    полем field объекты objs модели model."""
+    recount(model, field, counter,
+            {getattr(obj, f'{field}_id') for obj in objs})
+
+
+def insert_ignore_sql(connection, model, objs, returning=None):
+    """Запрос INSERT ... ON CONFLICT DO NOTHING для объектов objs
+    (как bulk_create(ignore_conflicts=True)) и его параметры.
+    returning — поле, значения которого вернут вставленные строки."""
+    ops = connection.ops
+    columns = [field for field in model._meta.local_concrete_fields
+               if not field.primary_key]
+    row = '({})'.format(', '.join(['%s'] * len(columns)))
+    sql = '{insert} {table} ({columns}) VALUES {rows} {suffix}'.format(
+        insert=ops.insert_statement(ignore_conflicts=True),
+        table=ops.quote_name(model._meta.db_table),
+        columns=', '.join(ops.quote_name(field.column) for field in columns),
+        rows=', '.join([row] * len(objs)),
+        suffix=ops.ignore_conflicts_suffix_sql(ignore_conflicts=True))
+    if returning is not None:
+        sql = f'{sql} RETURNING {ops.quote_name(returning.column)}'
+    params = [field.get_db_prep_save(field.pre_save(obj, True), connection)
+              for obj in objs for field in columns]
+    return sql, params
+
+
+def insert_ignore(model, **fields):
+    """Вставляет строку model одним запросом INSERT ... ON CONFLICT DO
+    NOTHING, как bulk_create(ignore_conflicts=True), но возвращает True,
+    только если строка действительно вставлена."""
+    connection = connections[router.db_for_write(model)]
+    sql, params = insert_ignore_sql(connection, model, [model(**fields)])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount == 1
+
+
+def insert_ignore_many(model, objs, field):
+    """Вставляет строки objs, пропуская уже существующие, и возвращает
+    значения поля field только у действительно вставленных строк.
+    Где СУБД умеет INSERT ... RETURNING (PostgreSQL), это один запрос,
+    иначе — по запросу на строку."""
+    field = model._meta.get_field(field)
+    connection = connections[router.db_for_write(model)]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        columns = [item.attname for item in model._meta.local_concrete_fields
+                   if not item.primary_key]
+        return {getattr(obj, field.attname) for obj in objs
+                if insert_ignore(model, **{
+                    column: getattr(obj, column) for column in columns})}
+    if not objs:
+        return set()
+    sql, params = insert_ignore_sql(connection, model, objs, field)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {value for value, in cursor.fetchall()}
+
+
+@transaction.atomic
+def add_relation(model, target_model, target_pk, counter, **fields):
+    """Создает связь model (избранное, покупка, подписка) и увеличивает
+    счетчик counter у объекта target_model, если связи еще не было.
+    Параллельные одинаковые запросы не приводят к ошибке уникальности."""
+    if not insert_ignore(model, **fields):
+        return False
+    target_model.objects.filter(pk=target_pk).update(
+        **{counter: F(counter) + 1})
+    return True
+
+
+@transaction.atomic
+def remove_relation(model, target_model, target_pk, counter, **fields):
+    """Удаляет связь model одним запросом DELETE и уменьшает счетчик
+    counter у объекта target_model на число удаленных строк."""
+    deleted, _ = model.objects.filter(**fields).delete()
+    if deleted:
+        target_model.objects.filter(pk=target_pk).update(
+            **{counter: decrement(counter, deleted)})
+    return bool(deleted)
+
+
+def recount(model, field, counter, pks):
+    """Пересчитывает счетчик counter у объектов с id из pks по числу
+    строк model, ссылающихся на них полем field."""
+    target_model = model._meta.get_field(field).related_model
+    target_model.objects.filter(pk__in=pks).update(
+        **{counter: count_subquery(model, field)})
+
+
+@transaction.atomic
+def add_relations(model, field, counter, user, pks):
+    """Пакетно создает связи пользователя с объектами pks одним
+    INSERT ... ON CONFLICT DO NOTHING и пересчитывает их счетчики.
+    Возвращает статус по каждому id: created, exists или not_found.
+    Статус created получают только строки, вставленные этим запросом,
+    поэтому параллельные одинаковые запросы не учитываются дважды."""
+    target_model = model._meta.get_field(field).related_model
+    found = set(target_model.objects.filter(
+        pk__in=pks).values_list('pk', flat=True))
+    created = insert_ignore_many(
+        model, [model(user=user, **{f'{field}_id': pk}) for pk in found],
+        field)
+    recount(model, field, counter, created)
+    return {pk: 'not_found' if pk not in found
+            else 'created' if pk in created
+            else 'exists'
+            for pk in pks}
+
+
+@transaction.atomic
+def remove_relations(model, field, counter, user, pks):
+    """Пакетно удаляет связи пользователя с объектами pks одним DELETE
+    и пересчитывает их счетчики. Возвращает статус по каждому id:
+    deleted или not_found. Удаляемые строки блокируются, чтобы
+    параллельный запрос не отчитался об их удалении второй раз."""
+    relations = model.objects.filter(user=user, **{f'{field}__in': pks})
+    deleted = set(relations.select_for_update().values_list(
+        field, flat=True))
+    relations.delete()
+    recount(model, field, counter, deleted)
+    return {pk: 'deleted' if pk in deleted else 'not_found' for pk in pks}
@@ -0,0 +1,53 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from recipes.storage import OverwriteStorage
+
+THUMBNAILS_DIR = 'recipes/thumbnails'
+
+storage = OverwriteStorage()
+
+
+def make_thumbnails(name):
+    """Создает уменьшенные копии картинки name шириной из
+    RECIPE_THUMBNAIL_WIDTHS в формате RECIPE_THUMBNAIL_FORMAT.
+    Возвращает словарь {ширина: имя файла в хранилище}.
+    Функция не обращается к базе данных и выполняется в процессах
+    пула команды process_images."""
+    image_format = settings.RECIPE_THUMBNAIL_FORMAT
+    stem = os.path.splitext(os.path.basename(name))[0]
+    extension = image_format.lower().replace('jpeg', 'jpg')
+    thumbnails = {
+        str(width): f'{THUMBNAILS_DIR}/{stem}_{width}.{extension}'
+        for width in settings.RECIPE_THUMBNAIL_WIDTHS
+    }
+    # Имя картинки — хэш содержимого, поэтому готовые копии с тем же
+    # именем не создаются повторно, а копии, одновременно созданные
+    # другим процессом, перезаписываются.
+    missing = {
+        width: thumbnail_name
+        for width, thumbnail_name in thumbnails.items()
+        if not storage.exists(thumbnail_name)
+    }
+    if not missing:
+        return thumbnails
+    with storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB' if image_format == 'JPEG' else 'RGBA')
+    for width, thumbnail_name in missing.items():
+        width = int(width)
+        thumbnail = image
+        if image.width > width:
+            thumbnail = image.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                Image.LANCZOS)
+        buffer = BytesIO()
+        thumbnail.save(buffer, image_format,
+                       quality=settings.RECIPE_THUMBNAIL_QUALITY)
+        storage.save(thumbnail_name, ContentFile(buffer.getvalue()))
+    return thumbnails
@@ -0,0 +1,230 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+from urllib.parse import quote, urljoin
+from urllib.request import urlopen
+
+from api.filters import IngredientsFilter
+from api.search import ingredient_index
+from api.views import RecipeViewSet
+from django.core.management import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from recipes import shopping_list
+from recipes.models import Ingredient, IngredientAmount, Recipe, Shopping
+from rest_framework.test import APIRequestFactory, force_authenticate
+from users.models import User
+
+UNITS = ('г', 'кг', 'мл', 'л', 'ч. л.', 'ст. л.', 'шт.')
+INGREDIENTS_PER_RECIPE = 10
+
+
+def percentiles(latencies):
+    """p50 и p99 по списку задержек (метод ближайшего ранга)."""
+    latencies = sorted(latencies)
+    return tuple(latencies[(len(latencies) * percent - 1) // 100]
+                 for percent in (50, 99))
+
+
+def measure(func, repeat):
+    """Задержки repeat вызовов func в миллисекундах."""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+class Command(BaseCommand):
+    """Замеры производительности на текущей базе данных.
+
+    connections — задержка цикла запроса (request_started, один запрос
+    к базе, request_finished) с настроенным переиспользованием
+    соединений или пулом и с закрытием соединения после каждого
+    запроса. Сравнение режимов — запуском с разными DB_CONN_MAX_AGE
+    и DB_POOL.
+
+    shopping_cart — число запросов и задержка выгрузки списка покупок
+    в зависимости от числа рецептов в корзине (--sizes).
+
+    ingredient_search — поиск ингредиентов по началу названия
+    (--queries) через ORM (istartswith) и через индекс в памяти
+    (INGREDIENT_SEARCH_INDEX) по справочнику в базе.
+
+    shopping_list — движок списков покупок на корзинах из сотен
+    рецептов (--sizes): добавление и удаление всей корзины
+    (add_recipes, remove_recipes) и сборка строк выгрузки с переводом
+    единиц (shopping_list_rows).
+
+    load — нагрузочный тест запущенного сервера (--url): --concurrency
+    потоков отправляют --requests запросов к --paths по кругу.
+    Выводит пропускную способность и задержки; синхронные и ASGI-воркеры
+    сравниваются запуском против сервера с ASYNC_VIEWS=False и True.
+
+    Данные для замеров создаются в транзакции, которая откатывается."""
+    help = "Measures latency of performance-sensitive code paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenario',
+            choices=('connections', 'shopping_cart', 'shopping_list',
+                     'ingredient_search', 'load'),
+            help='What to measure.')
+        parser.add_argument(
+            '--repeat', type=int, default=1000,
+            help='Measurements per case.')
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=(10, 50, 200),
+            help='Numbers of recipes in the cart.')
+        parser.add_argument(
+            '--queries', nargs='+', default=('с', 'сол', 'молоко'),
+            help='Ingredient name prefixes to search for.')
+        parser.add_argument(
+            '--url', default='http://localhost:8000',
+            help='Server to load-test.')
+        parser.add_argument(
+            '--paths', nargs='+',
+            default=('/api/recipes/', '/api/recipes/?limit=20',
+                     '/api/ingredients/?name=сол'),
+            help='Paths requested in turn by the load test.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        getattr(self, options['scenario'])(options)
+
+    def report(self, label, latencies):
+        p50, p99 = percentiles(latencies)
+        self.stdout.write(
+            f'{label}: p50 {p50:.3f} ms, p99 {p99:.3f} ms '
+            f'({len(latencies)} runs)')
+
+    def request_cycle(self):
+        request_started.send(sender=self.__class__)
+        User.objects.exists()
+        request_finished.send(sender=self.__class__)
+
+    def request_cycle_with_close(self):
+        self.request_cycle()
+        connection.close()
+
+    def connections(self, options):
+        settings_dict = connection.settings_dict
+        self.stdout.write(
+            f"ENGINE={settings_dict['ENGINE']} "
+            f"CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']} "
+            f"CONN_HEALTH_CHECKS={settings_dict.get('CONN_HEALTH_CHECKS')} "
+            f"POOL_SIZE={settings_dict.get('POOL_SIZE')}")
+        connection.close()
+        self.report('configured', measure(self.request_cycle,
+                                          options['repeat']))
+        connection.close()
+        self.report('closed after each request',
+                    measure(self.request_cycle_with_close,
+                            options['repeat']))
+
+    def create_cart(self, size):
+        """Пользователь с корзиной из size рецептов по
+        INGREDIENTS_PER_RECIPE ингредиентов в разных единицах."""
+        user = User.objects.create_user(
+            username='benchmark', email='benchmark@example.com',
+            first_name='benchmark', last_name='benchmark')
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Бенчмарк {i}', measurement_unit=UNITS[i % len(UNITS)])
+            for i in range(5 * INGREDIENTS_PER_RECIPE)]
+        servings = {}
+        for i in range(size):
+            recipe = Recipe.objects.create(
+                author=user, name=f'Бенчмарк {i}', text='benchmark',
+                cooking_time=1)
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe,
+                    ingredient=ingredients[(i + j * 5) % len(ingredients)],
+                    amount=10 + j)
+                for j in range(INGREDIENTS_PER_RECIPE))
+            servings[recipe.pk] = 1 + i % 3
+        Shopping.objects.bulk_create(
+            Shopping(user=user, recipe_id=pk, servings=count)
+            for pk, count in servings.items())
+        shopping_list.add_recipes(user.pk, servings)
+        return user, servings
+
+    def shopping_cart(self, options):
+        view = RecipeViewSet.as_view({'get': 'download_shopping_cart'})
+        factory = APIRequestFactory()
+        for size in options['sizes']:
+            with transaction.atomic():
+                user, _ = self.create_cart(size)
+
+                def download():
+                    request = factory.get(
+                        '/api/recipes/download_shopping_cart/')
+                    force_authenticate(request, user)
+                    b''.join(view(request).streaming_content)
+
+                with CaptureQueriesContext(connection) as queries:
+                    download()
+                self.report(f'{size} recipes, {len(queries)} queries',
+                            measure(download, options['repeat']))
+                transaction.set_rollback(True)
+
+    def shopping_list(self, options):
+        for size in options['sizes']:
+            with transaction.atomic():
+                user, servings = self.create_cart(size)
+
+                def add_and_remove():
+                    shopping_list.add_recipes(user.pk, servings)
+                    shopping_list.remove_recipes(user.pk, servings)
+
+                rows = len(list(shopping_list.shopping_list_rows(user)))
+                self.report(f'{size} recipes: add and remove cart',
+                            measure(add_and_remove, options['repeat']))
+                self.report(
+                    f'{size} recipes: {rows} shopping list rows',
+                    measure(lambda: list(
+                        shopping_list.shopping_list_rows(user)),
+                        options['repeat']))
+                transaction.set_rollback(True)
+
+    def ingredient_search(self, options):
+        self.stdout.write(f'{Ingredient.objects.count()} ingredients')
+        ingredient_index.load()
+        for query in options['queries']:
+            filterset = IngredientsFilter(
+                {'name': query}, queryset=Ingredient.objects.all())
+            found = len(filterset.qs)
+            self.report(f'ORM {query!r} ({found} found)',
+                        measure(lambda: list(filterset.qs.all()),
+                                options['repeat']))
+            found = len(ingredient_index.search(query))
+            self.report(f'index {query!r} ({found} found)',
+                        measure(lambda: ingredient_index.search(query),
+                                options['repeat']))
+
+    def load(self, options):
+        urls = [urljoin(options['url'], quote(path, safe='/?=&'))
+                for path in options['paths']]
+        errors = []
+
+        def fetch(number):
+            started = time.perf_counter()
+            try:
+                with urlopen(urls[number % len(urls)], timeout=30) as response:
+                    response.read()
+            except (URLError, OSError) as error:
+                errors.append(error)
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            latencies = list(executor.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        self.report(
+            f'{options["url"]}, concurrency {options["concurrency"]}: '
+            f'{len(latencies) / elapsed:.0f} requests/s, '
+            f'{len(errors)} errors', latencies)
@@ -0,0 +1,63 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import BaseCommand, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from recipes.models import Ingredient, Tag
+
+STATIC_STAMP = '.collectstatic'
+
+
+def static_fingerprint():
+    """Хеш списка исходных статических файлов с их размером и временем
+    изменения. Меняется при обновлении приложений и их статики."""
+    digest = hashlib.sha256()
+    for finder in get_finders():
+        for path, storage in finder.list(ignore_patterns=None):
+            stat = os.stat(storage.path(path))
+            digest.update(
+                f'{path}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    """Подготовка контейнера к запуску в одном процессе: миграции,
+    сбор статики и загрузка справочников выполняются, только если
+    они еще не сделаны."""
+    help = "Applies pending migrations, collects changed static files " \
+           "and loads reference data when missing"
+
+    def handle(self, *args, **kwargs):
+        self.migrate()
+        self.collectstatic()
+        self.load_reference_data()
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if not plan:
+            self.stdout.write('Migrations: up to date.')
+            return
+        call_command('migrate', interactive=False)
+
+    def collectstatic(self):
+        stamp = os.path.join(settings.STATIC_ROOT, STATIC_STAMP)
+        fingerprint = static_fingerprint()
+        if os.path.exists(stamp):
+            with open(stamp) as file:
+                if file.read() == fingerprint:
+                    self.stdout.write('Static files: up to date.')
+                    return
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(stamp, 'w') as file:
+            file.write(fingerprint)
+        self.stdout.write('Static files: collected.')
+
+    def load_reference_data(self):
+        if Ingredient.objects.exists() and Tag.objects.exists():
+            self.stdout.write('Reference data: already loaded.')
+            return
+        call_command('load_csv')
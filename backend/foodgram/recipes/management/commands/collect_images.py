@@ -0,0 +1,83 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from recipes.models import ImageBlob, Recipe
+
+MEDIA_DIR = 'recipes'
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища, включая вложенные. Каталога может
+    еще не быть, если ни одна картинка не загружена."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    """Сборка мусора в медиафайлах рецептов за один проход:
+    пересчитывает ссылки ImageBlob по таблице рецептов (в том числе
+    после bulk-загрузок, минуя сигналы), удаляет файлы, на которые
+    не ссылается ни один рецепт, и выводит объем, сэкономленный
+    дедупликацией. Перед удалением ссылка на файл проверяется еще раз:
+    рецепт мог быть сохранен после первого прохода."""
+    help = "Removes orphaned recipe media and reports deduplication savings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Keep unreferenced files younger than this many seconds: '
+                 'they may belong to a request that is still running.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be removed.')
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        references = dict(
+            Recipe.objects.order_by().values('image').annotate(
+                count=Count('id')).values_list('image', 'count'))
+        referenced = set(references)
+        for thumbnails in Recipe.objects.values_list(
+                'thumbnails', flat=True):
+            referenced.update(thumbnails.values())
+        if not options['dry_run']:
+            self.recount(storage, references)
+        threshold = timezone.now() - timedelta(seconds=options['min_age'])
+        removed = freed = 0
+        for name in list(walk(storage, MEDIA_DIR)):
+            if (name in referenced
+                    or storage.get_modified_time(name) > threshold
+                    or Recipe.objects.filter(image=name).exists()):
+                continue
+            removed += 1
+            freed += storage.size(name)
+            if not options['dry_run']:
+                storage.delete(name)
+        saved = ImageBlob.objects.filter(references__gt=1).aggregate(
+            saved=Sum(F('size') * (F('references') - 1)))['saved'] or 0
+        self.stdout.write(
+            f'Removed {removed} files ({freed} bytes). '
+            f'Deduplication saves {saved} bytes.')
+
+    def recount(self, storage, references):
+        blobs = ImageBlob.objects.in_bulk(field_name='name')
+        changed = []
+        for name, count in references.items():
+            blob = blobs.pop(name, None)
+            if blob is None:
+                if storage.exists(name):
+                    ImageBlob.objects.create(
+                        name=name, size=storage.size(name), references=count)
+            elif blob.references != count:
+                blob.references = count
+                changed.append(blob)
+        ImageBlob.objects.bulk_update(changed, ['references'])
+        ImageBlob.objects.filter(name__in=list(blobs)).delete()
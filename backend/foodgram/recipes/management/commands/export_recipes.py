@@ -0,0 +1,78 @@
+import json
+import tarfile
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db.models import Prefetch
+from recipes.models import IngredientAmount, Recipe
+
+
+def recipe_batches(batch_size):
+    """Рецепты со связанными объектами пачками по первичному ключу,
+    без OFFSET и без загрузки всей таблицы в память."""
+    last_pk = 0
+    while True:
+        batch = list(
+            Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+            .select_related('author')
+            .prefetch_related(
+                'tags',
+                Prefetch('ingredientamount_set',
+                         IngredientAmount.objects.select_related(
+                             'ingredient')))[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def serialize(recipe):
+    """Рецепт в виде словаря с естественными ключами связанных объектов:
+    email автора, slug тегов, название и единица измерения ингредиентов."""
+    return {
+        'id': recipe.pk,
+        'author': recipe.author.email if recipe.author else None,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image': recipe.image.name,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            [amount.ingredient.name,
+             amount.ingredient.measurement_unit,
+             amount.amount]
+            for amount in recipe.ingredientamount_set.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    """Выгрузка рецептов в файл JSON Lines (один рецепт на строку)
+    и картинок рецептов в tar-архив для переноса между окружениями."""
+    help = "Exports recipes as newline-delimited JSON and a media tarball"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the .ndjson file.')
+        parser.add_argument(
+            '--media', help='Path of the tar archive with recipe images.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        media = (tarfile.open(options['media'], 'w')
+                 if options['media'] else None)
+        exported = 0
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            for batch in recipe_batches(options['batch_size']):
+                for recipe in batch:
+                    output.write(
+                        json.dumps(serialize(recipe), ensure_ascii=False))
+                    output.write('\n')
+                    if (media is not None and recipe.image
+                            and default_storage.exists(recipe.image.name)):
+                        media.add(default_storage.path(recipe.image.name),
+                                  arcname=recipe.image.name)
+                exported += len(batch)
+        if media is not None:
+            media.close()
+        self.stdout.write(f'Exported {exported} recipes.')
@@ -0,0 +1,144 @@
+import json
+import os
+import tarfile
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from recipes.models import (ImportCheckpoint, Ingredient, IngredientAmount,
+                            Recipe, Tag)
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Загрузка рецептов, выгруженных командой export_recipes.
+    Рецепты вставляются через bulk_create пачками, каждая пачка в своей
+    транзакции. В той же транзакции число обработанных строк
+    записывается в ImportCheckpoint, и повторный запуск продолжает
+    загрузку с этого места. Рецепты авторов, которых нет в базе,
+    не загружаются: команда завершается с ошибкой и списком email."""
+    help = "Imports recipes exported by export_recipes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Path of the .ndjson file.')
+        parser.add_argument(
+            '--media', help='Path of the tar archive with recipe images.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore the checkpoint and start from the first line.')
+
+    def handle(self, *args, **options):
+        if options['media']:
+            self.import_media(options['media'])
+        source = os.path.abspath(options['input'])
+        if options['restart']:
+            ImportCheckpoint.objects.filter(source=source).delete()
+        checkpoint = ImportCheckpoint.objects.filter(source=source).first()
+        done = checkpoint.lines if checkpoint else 0
+        if done:
+            self.stdout.write(f'Resuming after line {done}.')
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): id for id, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        }
+        imported = 0
+        with open(options['input'], encoding='utf-8') as file:
+            lines = islice(file, done, None)
+            batch = list(islice(lines, options['batch_size']))
+            while batch:
+                with transaction.atomic():
+                    self.import_batch([json.loads(line) for line in batch])
+                    done += len(batch)
+                    ImportCheckpoint.objects.update_or_create(
+                        source=source, defaults={'lines': done})
+                imported += len(batch)
+                self.stdout.write(f'{done} lines processed.')
+                batch = list(islice(lines, options['batch_size']))
+        self.stdout.write(f'Imported {imported} recipes.')
+
+    def import_media(self, path):
+        """Распаковывает картинки в хранилище, пропуская уже существующие
+        файлы и пути за пределами каталога recipes/."""
+        with tarfile.open(path) as media:
+            for member in media:
+                name = os.path.normpath(member.name)
+                if (not member.isfile() or not name.startswith('recipes/')
+                        or default_storage.exists(name)):
+                    continue
+                default_storage.save(name, media.extractfile(member))
+
+    def load_ingredients(self, items):
+        """Дополняет словарь id ингредиентов по естественному ключу
+        (название, единица измерения). Отсутствующие ингредиенты
+        создаются одним запросом."""
+        keys = {
+            (name, unit)
+            for item in items for name, unit, _ in item['ingredients']
+        }
+        missing = keys - self.ingredients.keys()
+        if missing:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in missing),
+                ignore_conflicts=True)
+            for id, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in missing}
+            ).values_list('id', 'name', 'measurement_unit'):
+                self.ingredients[(name, unit)] = id
+
+    def import_batch(self, items):
+        unknown_tags = {
+            slug for item in items for slug in item['tags']
+        } - self.tags.keys()
+        if unknown_tags:
+            raise CommandError(f'Unknown tags: {", ".join(unknown_tags)}')
+        authors = dict(User.objects.filter(
+            email__in={item['author'] for item in items}
+        ).values_list('email', 'id'))
+        unknown_authors = {item['author'] for item in items} - authors.keys()
+        if unknown_authors:
+            raise CommandError(
+                f'{len(unknown_authors)} unknown authors: '
+                f'{", ".join(sorted(unknown_authors))}')
+        recipes = [
+            Recipe(
+                author_id=authors[item['author']],
+                name=item['name'],
+                text=item['text'],
+                cooking_time=item['cooking_time'],
+                image=item['image'])
+            for item in items
+        ]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+        # auto_now_add перезаписывает pub_date при вставке.
+        for recipe, item in zip(recipes, items):
+            recipe.pub_date = datetime.fromisoformat(item['pub_date'])
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+        self.load_ingredients(items)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe,
+                ingredient_id=self.ingredients[(name, unit)],
+                amount=amount)
+            for recipe, item in zip(recipes, items)
+            for name, unit, amount in item['ingredients'])
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk,
+                                tag_id=self.tags[slug])
+            for recipe, item in zip(recipes, items)
+            for slug in item['tags'])
+        for author_id, count in Counter(
+            recipe.author_id for recipe in recipes
+        ).items():
+            User.objects.filter(pk=author_id).update(
+                recipes_count=F('recipes_count') + count)
@@ -1,31 +1,93 @@
 import csv
+import time
+from itertools import islice
 
 from django.conf import settings
 from django.core.management import BaseCommand
+from django.db import connection, transaction
 from recipes.models import Ingredient, Tag
 
-ALREDY_LOADED_ERROR_MESSAGE = 'The database is already loaded.'
-
 ingredients_file = f'{settings.BASE_DIR}/data/ingredients.csv'
 tags_file = f'{settings.BASE_DIR}/data/tags.csv'
 
-CSV_DATA = {Ingredient: ingredients_file,
-            Tag: tags_file}
+# Модель, файл и поля в порядке столбцов CSV. Повторная загрузка
+# пропускает строки, нарушающие уникальность (естественный ключ).
+CSV_DATA = (
+    (Ingredient, ingredients_file, ('name', 'measurement_unit')),
+    (Tag, tags_file, ('name', 'color', 'slug')),
+)
+
+
+def read_batches(csv_file, batch_size):
+    """Читает CSV-файл потоком, по batch_size строк за раз."""
+    with open(csv_file, encoding='utf-8') as file:
+        reader = csv.reader(file)
+        batch = list(islice(reader, batch_size))
+        while batch:
+            yield batch
+            batch = list(islice(reader, batch_size))
 
 
 class Command(BaseCommand):
     """Загрузка готовой базы данных для моделей Ingredient
-    и Tag."""
+    и Tag. Команду можно безопасно запускать повторно: уже загруженные
+    строки пропускаются. На PostgreSQL данные загружаются через COPY."""
     help = "Loads data from csv files"
 
-    def handle(self, *args, **kwargs):
-        for model, csv_file in CSV_DATA.items():
-            if model.objects.exists():
-                print(ALREDY_LOADED_ERROR_MESSAGE)
-                return
-
-            with open(csv_file, encoding='utf-8') as file:
-                reader = csv.reader(file)
-                for id, row in enumerate(reader):
-                    data = model(id+1, *row)
-                    data.save()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per INSERT when COPY is not used.')
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Use bulk_create even on PostgreSQL.')
+
+    def handle(self, *args, **options):
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
+        for model, csv_file, fields in CSV_DATA:
+            started = time.monotonic()
+            with transaction.atomic():
+                if use_copy:
+                    read, created = self.copy(model, csv_file, fields)
+                else:
+                    read, created = self.bulk_create(
+                        model, csv_file, fields, options['batch_size'])
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {read} rows read, '
+                f'{created} created in {elapsed:.2f}s '
+                f'({read / elapsed:.0f} rows/s)')
+
+    def bulk_create(self, model, csv_file, fields, batch_size):
+        before = model.objects.count()
+        read = 0
+        for batch in read_batches(csv_file, batch_size):
+            model.objects.bulk_create(
+                (model(**dict(zip(fields, row))) for row in batch),
+                ignore_conflicts=True)
+            read += len(batch)
+        return read, model.objects.count() - before
+
+    def copy(self, model, csv_file, fields):
+        """COPY во временную таблицу и INSERT ... ON CONFLICT DO NOTHING
+        в таблицу модели."""
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        columns = ', '.join(quote(field) for field in fields)
+        with connection.cursor() as cursor, open(
+                csv_file, encoding='utf-8') as file:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE load_csv_rows ('
+                + ', '.join(f'{quote(field)} text' for field in fields)
+                + ') ON COMMIT DROP')
+            cursor.copy_expert(
+                f'COPY load_csv_rows ({columns}) FROM STDIN '
+                'WITH (FORMAT csv)', file)
+            cursor.execute('SELECT COUNT(*) FROM load_csv_rows')
+            read = cursor.fetchone()[0]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM load_csv_rows '
+                'ON CONFLICT DO NOTHING')
+            return read, cursor.rowcount
@@ -0,0 +1,84 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connection, connections, transaction
+from recipes.images import make_thumbnails
+from recipes.models import ImageStatus, Recipe
+
+
+class Command(BaseCommand):
+    """Обработчик очереди картинок рецептов. Очередью служит таблица
+    рецептов: рецепты со статусом pending забираются пачками
+    (SELECT ... FOR UPDATE SKIP LOCKED, если СУБД это поддерживает),
+    а уменьшенные копии создаются в пуле процессов."""
+    help = "Creates recipe image thumbnails outside of the request cycle"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_WORKERS,
+            help='Size of the process pool.')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when the queue is empty.')
+        parser.add_argument(
+            '--requeue', action='store_true',
+            help='Return recipes left in "processing" by a stopped runner '
+                 'to the queue before starting.')
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            Recipe.objects.filter(
+                image_status=ImageStatus.PROCESSING
+            ).update(image_status=ImageStatus.PENDING)
+        # Процессы пула создаются fork'ом и не должны наследовать
+        # открытые соединения с базой данных.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = self.claim(options['batch_size'])
+                if batch:
+                    self.process(pool, batch)
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+
+    def claim(self, batch_size):
+        """Забирает из очереди пачку рецептов и помечает их как
+        обрабатываемые."""
+        with transaction.atomic():
+            queryset = Recipe.objects.filter(
+                image_status=ImageStatus.PENDING).order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            batch = list(queryset.values_list('id', 'image')[:batch_size])
+            Recipe.objects.filter(
+                id__in=[id for id, _ in batch]
+            ).update(image_status=ImageStatus.PROCESSING)
+        return batch
+
+    def process(self, pool, batch):
+        # Рецепты с одинаковой картинкой ссылаются на один файл,
+        # поэтому каждая картинка обрабатывается один раз.
+        futures = {image: pool.submit(make_thumbnails, image)
+                   for image in {image for _, image in batch}}
+        for id, image in batch:
+            future = futures[image]
+            try:
+                thumbnails = future.result()
+            except Exception as error:
+                self.stderr.write(f'Recipe {id}: {error}')
+                values = {'image_status': ImageStatus.FAILED}
+            else:
+                values = {'image_status': ImageStatus.DONE,
+                          'thumbnails': thumbnails}
+            # Если картинку заменили во время обработки, рецепт остается
+            # в очереди с новой картинкой.
+            Recipe.objects.filter(id=id, image=image).update(**values)
+        self.stdout.write(f'Processed {len(batch)} images.')
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from recipes.shopping_list import check_shopping_lists, rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    """Пересборка готовых списков покупок по таблицам Shopping
+    и IngredientAmount. С --check только сравнивает сохраненные списки
+    с вычисленными и завершается с ошибкой при расхождениях."""
+    help = "Rebuilds materialized shopping lists or checks their consistency"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report items that differ from recomputed lists.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_lists()
+            return
+        with transaction.atomic():
+            items = rebuild_shopping_lists()
+        self.stdout.write(f'Shopping lists rebuilt: {items} items.')
+
+    def check_lists(self):
+        mismatches = check_shopping_lists()
+        for user_id, ingredient_id, stored, expected in mismatches:
+            self.stdout.write(
+                f'user {user_id}, ingredient {ingredient_id}: '
+                f'stored {stored}, expected {expected}')
+        if mismatches:
+            raise CommandError(
+                f'{len(mismatches)} shopping list items are inconsistent.')
+        self.stdout.write('Shopping lists are consistent.')
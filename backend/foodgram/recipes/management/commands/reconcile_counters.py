@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    """Пересчет счетчиков избранного, списков покупок, рецептов
+    и подписчиков по фактическим данным."""
+    help = "Recomputes denormalized recipe and user counters"
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            recipes, users = reconcile_counters()
+        self.stdout.write(
+            f'Counters updated: {recipes} recipes, {users} users.')
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Django строит для istartswith/icontains на PostgreSQL выражение
+# UPPER("name"::text) LIKE ..., поэтому индексы создаются по нему же.
+POSTGRESQL_INDEXES = (
+    ('recipes_ingredient_name_upper_like',
+     'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_like '
+     'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)'),
+    ('recipes_ingredient_name_upper_trgm',
+     'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm '
+     'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)'),
+    ('recipes_recipe_name_upper_trgm',
+     'CREATE INDEX IF NOT EXISTS recipes_recipe_name_upper_trgm '
+     'ON recipes_recipe USING gin (UPPER(name::text) gin_trgm_ops)'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for _, sql in POSTGRESQL_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in POSTGRESQL_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_auto_20230601_0613'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:04
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count'),
+            output_field=IntegerField()),
+        0)
+
+
+def fill_counters(apps, schema_editor):
+    recipe_model = apps.get_model('recipes', 'Recipe')
+    user_model = apps.get_model('users', 'User')
+    recipe_model.objects.update(
+        favorites_count=count_subquery(
+            apps.get_model('recipes', 'Favorite'), 'recipe'),
+        shopping_count=count_subquery(
+            apps.get_model('recipes', 'Shopping'), 'recipe'))
+    user_model.objects.update(
+        recipes_count=count_subquery(recipe_model, 'author'),
+        followers_count=count_subquery(
+            apps.get_model('users', 'Subscription'), 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_filter_indexes'),
+        ('users', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date'], name='recipe_popularity_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import Counter
+
+
+def fill_shopping_lists(apps, schema_editor):
+    ingredient_amount_model = apps.get_model('recipes', 'IngredientAmount')
+    shopping_model = apps.get_model('recipes', 'Shopping')
+    item_model = apps.get_model('recipes', 'ShoppingListItem')
+    recipe_ingredients = {}
+    for recipe_id, ingredient_id, amount in (
+            ingredient_amount_model.objects.values_list(
+                'recipe_id', 'ingredient_id', 'amount').iterator()):
+        recipe_ingredients.setdefault(recipe_id, []).append(
+            (ingredient_id, amount))
+    items = Counter()
+    for user_id, recipe_id in shopping_model.objects.values_list(
+            'user_id', 'recipe_id').iterator():
+        for ingredient_id, amount in recipe_ingredients.get(recipe_id, ()):
+            items[user_id, ingredient_id] += amount
+    item_model.objects.bulk_create(
+        (item_model(user_id=user_id, ingredient_id=ingredient_id,
+                    amount=amount)
+         for (user_id, ingredient_id), amount in items.items()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Позиции списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_user_ingredient_shopping_list'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
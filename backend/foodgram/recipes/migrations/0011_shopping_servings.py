@@ -0,0 +1,24 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:26
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_shopping_list'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopping',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)], verbose_name='Множитель порций'),
+        ),
+        migrations.AlterField(
+            model_name='shoppinglistitem',
+            name='amount',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Количество'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:27
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Вектор по названию (вес A) и описанию (вес B) поддерживает триггер:
+# он пересчитывается только при изменении name или text, а не при
+# обновлении счетчиков рецепта.
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce({row}name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce({row}text, '')), 'B')")
+
+CREATE_TRIGGER = f'''
+CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_search_vector_trigger
+BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update();
+
+UPDATE recipes_recipe SET search_vector = {SEARCH_VECTOR.format(row='')};
+
+CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin
+ON recipes_recipe USING gin (search_vector);
+'''
+
+DROP_TRIGGER = '''
+DROP INDEX IF EXISTS recipes_recipe_search_vector_gin;
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger ON recipes_recipe;
+DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update();
+'''
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_shopping_servings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
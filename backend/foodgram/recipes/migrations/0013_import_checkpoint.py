@@ -0,0 +1,25 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_full_text_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('lines', models.PositiveIntegerField(default=0, verbose_name='Загружено строк')),
+            ],
+            options={
+                'verbose_name': 'Прогресс загрузки рецептов',
+                'verbose_name_plural': 'Прогресс загрузки рецептов',
+            },
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.core.validators import MinValueValidator, RegexValidator
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import (MaxValueValidator, MinValueValidator,
+                                    RegexValidator)
 from django.db import models
+from recipes.storage import ContentAddressedStorage
 from users.models import User
 
 
@@ -49,15 +52,33 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit')]
 
     def __str__(self):
         return self.name
 
 
+class ImageStatus(models.TextChoices):
+    """Состояние обработки картинки рецепта в очереди process_images."""
+    PENDING = 'pending', 'Ожидает обработки'
+    PROCESSING = 'processing', 'Обрабатывается'
+    DONE = 'done', 'Обработана'
+    FAILED = 'failed', 'Ошибка обработки'
+
+
 class Recipe(models.Model):
     """Модель Recipe.
     Значения полей is_favorited и is_in_shopping_cart берется из
-    соответствующих методов вьюсета для модели Recipe."""
+    соответствующих методов вьюсета для модели Recipe.
+    Счетчики favorites_count и shopping_count обновляются вьюсетом
+    и админкой и пересчитываются командой reconcile_counters.
+    Уменьшенные копии картинки (thumbnails) создаются вне запроса
+    командой process_images.
+    Поисковый вектор (search_vector) по названию и описанию заполняет
+    триггер PostgreSQL (миграция 0012_full_text_search)."""
     tags = models.ManyToManyField(
         Tag,
         blank=False,
@@ -88,8 +109,21 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='recipes/',
+        storage=ContentAddressedStorage(),
         blank=False
     )
+    image_status = models.CharField(
+        max_length=10,
+        choices=ImageStatus.choices,
+        default=ImageStatus.PENDING,
+        editable=False,
+        verbose_name='Обработка картинки'
+    )
+    thumbnails = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки'
+    )
     text = models.TextField(
         blank=False,
         verbose_name='Описание'
@@ -102,11 +136,36 @@ class Recipe(models.Model):
         verbose_name='Время приготовления (в минутах)'
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    shopping_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['-favorites_count', '-pub_date'],
+                         name='recipe_popularity_idx'),
+            models.Index(fields=['id'],
+                         condition=models.Q(image_status=ImageStatus.PENDING),
+                         name='recipe_image_pending_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -164,6 +223,10 @@ class Favorite(models.Model):
                 name='unique_user_recipe_favorite'
             )
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='favorite_recipe_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.user}'
@@ -183,6 +246,11 @@ class Shopping(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт'
     )
+    servings = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        verbose_name='Множитель порций'
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -193,6 +261,88 @@ class Shopping(models.Model):
                 name='unique_user_recipe_shopping'
             )
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='shopping_recipe_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    """Строка готового списка покупок пользователя: суммарное количество
+    ингредиента во всех рецептах из Shopping. Поддерживается
+    инкрементально (recipes/shopping_list.py)."""
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveBigIntegerField(
+        default=0, verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient_shopping_list'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient} {self.amount}'
+
+
+class ImageBlob(models.Model):
+    """Файл картинки в ContentAddressedStorage и число рецептов,
+    которые на него ссылаются. Файлы без ссылок удаляет команда
+    collect_images."""
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл'
+    )
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ссылок'
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class ImportCheckpoint(models.Model):
+    """Число строк файла, уже загруженных командой import_recipes.
+    Обновляется в той же транзакции, что и пачка рецептов, поэтому
+    после сбоя загрузка продолжается ровно с первой незагруженной
+    строки."""
+    source = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл'
+    )
+    lines = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Загружено строк'
+    )
+
+    class Meta:
+        verbose_name = 'Прогресс загрузки рецептов'
+        verbose_name_plural = 'Прогресс загрузки рецептов'
+
+    def __str__(self):
+        return f'{self.source}: {self.lines}'
@@ -0,0 +1,163 @@
+"""Инкрементальное обновление готовых списков покупок (ShoppingListItem).
+
+Изменения выражаются словарем {ingredient_id: изменение количества},
+который применяется сразу ко всем затронутым пользователям: вставка
+недостающих строк, один UPDATE и удаление обнулившихся строк."""
+from collections import Counter
+
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+from recipes.models import IngredientAmount, Shopping, ShoppingListItem
+from recipes.units import base_unit, humanize, unit_factor
+
+
+def recipe_amounts(recipe_servings, sign=1):
+    """Суммарное количество каждого ингредиента в рецептах с учетом
+    множителя порций: recipe_servings — {recipe_id: servings}."""
+    amounts = Counter()
+    for recipe_id, ingredient_id, amount in IngredientAmount.objects.filter(
+            recipe_id__in=recipe_servings).values_list(
+                'recipe_id', 'ingredient_id', 'amount'):
+        amounts[ingredient_id] += sign * amount * recipe_servings[recipe_id]
+    return amounts
+
+
+def cart_servings(user_id, recipe_ids):
+    """Множители порций рецептов в корзине пользователя:
+    {recipe_id: servings}. Строки Shopping блокируются до конца
+    транзакции, чтобы множитель не изменился до вычитания."""
+    return dict(Shopping.objects.select_for_update().filter(
+        user_id=user_id, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'servings'))
+
+
+def apply_deltas(user_ids, deltas):
+    """Изменяет списки покупок пользователей user_ids на deltas."""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not (user_ids and deltas):
+        return
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+         for user_id in user_ids
+         for ingredient_id, delta in deltas.items() if delta > 0],
+        ignore_conflicts=True)
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    items.update(amount=Greatest(
+        F('amount') + Case(
+            *(When(ingredient_id=pk, then=Value(delta))
+              for pk, delta in deltas.items()),
+            default=Value(0)),
+        Value(0)))
+    if any(delta < 0 for delta in deltas.values()):
+        items.filter(amount=0).delete()
+
+
+def add_recipes(user_id, recipe_servings):
+    """Рецепты добавлены в список покупок пользователя
+    (или увеличен их множитель порций): {recipe_id: servings}."""
+    apply_deltas([user_id], recipe_amounts(recipe_servings))
+
+
+def remove_recipes(user_id, recipe_servings):
+    """Рецепты удалены из списка покупок пользователя:
+    {recipe_id: servings}."""
+    apply_deltas([user_id], recipe_amounts(recipe_servings, sign=-1))
+
+
+def carts_with(recipe):
+    """Пользователи, у которых рецепт в списке покупок, по множителю
+    порций: {servings: [user_id, ...]}."""
+    carts = {}
+    for user_id, servings in Shopping.objects.filter(
+            recipe=recipe).values_list('user_id', 'servings'):
+        carts.setdefault(servings, []).append(user_id)
+    return carts
+
+
+def change_recipe(recipe, deltas):
+    """Состав рецепта изменился на deltas: обновляет списки покупок
+    всех пользователей, у которых он в корзине."""
+    if not deltas:
+        return
+    for servings, user_ids in carts_with(recipe).items():
+        apply_deltas(user_ids, {pk: delta * servings
+                                for pk, delta in deltas.items()})
+
+
+def remove_recipe(recipe):
+    """Рецепт удаляется: вычитает его из всех списков покупок."""
+    change_recipe(recipe, recipe_amounts({recipe.pk: 1}, sign=-1))
+
+
+def shopping_list_rows(user):
+    """Список покупок пользователя для выгрузки: строки
+    (название, единица, количество), где количества одного продукта
+    в разных единицах (г и кг, мл и л, ч. л. и ст. л.) сложены
+    в базовой единице одним запросом и переведены в крупную единицу."""
+    rows = user.shopping_list.order_by().values(
+        'ingredient__name',
+        unit=base_unit('ingredient__measurement_unit'),
+    ).annotate(
+        total=Sum(F('amount') * unit_factor('ingredient__measurement_unit'),
+                  output_field=BigIntegerField())
+    ).order_by('ingredient__name', 'unit').values_list(
+        'ingredient__name', 'unit', 'total')
+    for name, unit, total in rows:
+        unit, amount = humanize(unit, total)
+        yield name, unit, amount
+
+
+def expected_items():
+    """Списки покупок, вычисленные заново по Shopping и IngredientAmount:
+    {(user_id, ingredient_id): amount}."""
+    recipe_ingredients = {}
+    for recipe_id, ingredient_id, amount in (
+            IngredientAmount.objects.values_list(
+                'recipe_id', 'ingredient_id', 'amount').iterator()):
+        recipe_ingredients.setdefault(recipe_id, []).append(
+            (ingredient_id, amount))
+    expected = Counter()
+    for user_id, recipe_id, servings in Shopping.objects.values_list(
+            'user_id', 'recipe_id', 'servings').iterator():
+        for ingredient_id, amount in recipe_ingredients.get(recipe_id, ()):
+            expected[user_id, ingredient_id] += amount * servings
+    return expected
+
+
+def stored_items():
+    """Списки покупок из ShoppingListItem:
+    {(user_id, ingredient_id): amount}."""
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in (
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount').iterator())
+    }
+
+
+def rebuild_shopping_lists(batch_size=1000):
+    """Заполняет ShoppingListItem заново. Возвращает число строк."""
+    expected = expected_items()
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          amount=amount)
+         for (user_id, ingredient_id), amount in expected.items()),
+        batch_size=batch_size)
+    return len(expected)
+
+
+def check_shopping_lists():
+    """Сравнивает ShoppingListItem с вычисленными заново списками.
+    Возвращает расхождения: [(user_id, ingredient_id, stored, expected)]."""
+    expected = expected_items()
+    stored = stored_items()
+    return [
+        (user_id, ingredient_id,
+         stored.get((user_id, ingredient_id), 0),
+         expected.get((user_id, ingredient_id), 0))
+        for user_id, ingredient_id in sorted(expected.keys() | stored.keys())
+        if stored.get((user_id, ingredient_id), 0)
+        != expected.get((user_id, ingredient_id), 0)
+    ]
@@ -0,0 +1,35 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from recipes.models import ImageBlob, Recipe
+
+
+def change_references(name, delta):
+    if not name:
+        return
+    if delta > 0 and not ImageBlob.objects.filter(name=name).exists():
+        storage = Recipe._meta.get_field('image').storage
+        ImageBlob.objects.get_or_create(
+            name=name, defaults={'size': storage.size(name)})
+    ImageBlob.objects.filter(name=name).update(
+        references=F('references') + delta)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    instance._saved_image = instance.image.name
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_references(sender, instance, created, **kwargs):
+    if instance.image.name == instance._saved_image and not created:
+        return
+    change_references(instance.image.name, 1)
+    if not created:
+        change_references(instance._saved_image, -1)
+    instance._saved_image = instance.image.name
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image(sender, instance, **kwargs):
+    change_references(instance._saved_image, -1)
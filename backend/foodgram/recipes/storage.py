@@ -0,0 +1,63 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from PIL import Image, UnidentifiedImageError
+
+
+class OverwriteStorage(FileSystemStorage):
+    """Хранилище для файлов, имя которых определяется содержимым.
+    Файл с занятым именем перезаписывается, а не сохраняется под новым
+    именем с суффиксом: при гонке параллельных записей остается один
+    файл."""
+    OS_OPEN_FLAGS = (FileSystemStorage.OS_OPEN_FLAGS & ~os.O_EXCL
+                     | os.O_TRUNC)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        # Временный файл загрузки перемещается без перезаписи
+        # существующего, поэтому его содержимое копируется.
+        if hasattr(content, 'temporary_file_path'):
+            content = File(content.file, content.name)
+        return super()._save(name, content)
+
+
+class ContentAddressedStorage(OverwriteStorage):
+    """Хранилище, в котором имя файла — SHA-256 его содержимого:
+    recipes/ab/abcdef....jpg. Расширение определяется по формату
+    картинки, а не по имени или MIME-типу от клиента, чтобы одно
+    содержимое не сохранялось дважды (.jpg и .jpeg). Если такой файл
+    уже есть, повторная загрузка той же картинки не записывается
+    на диск, но время изменения файла обновляется: сборщик мусора
+    collect_images не удаляет недавно загруженные файлы, даже если
+    ссылка на них еще не сохранена."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        try:
+            image_format = Image.open(content).format
+        except UnidentifiedImageError:
+            pass
+        else:
+            extension = '.' + image_format.lower().replace('jpeg', 'jpg')
+        content.seek(0)
+        content_hash = digest.hexdigest()
+        name = posixpath.join(
+            directory, content_hash[:2], f'{content_hash}{extension}')
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
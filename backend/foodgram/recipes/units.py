@@ -0,0 +1,53 @@
+"""Приведение единиц измерения ингредиентов к базовой единице.
+
+Один и тот же продукт в справочнике может быть записан в граммах
+и в килограммах, в миллилитрах и в литрах, в чайных и в столовых
+ложках. Для списка покупок количества суммируются в базовой единице
+и выводятся в наиболее крупной подходящей."""
+from django.db.models import Case, F, IntegerField, Value, When
+
+# Единица измерения: (базовая единица, число базовых единиц в ней).
+UNIT_CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('ч. л.', 1),
+    'ст. л.': ('ч. л.', 3),
+}
+
+# Для метрических единиц крупная единица выбирается при любом
+# количестве от одной штуки, для ложек — только при целом числе.
+FRACTIONAL_UNITS = {'кг', 'л'}
+
+
+def base_unit(field):
+    """Выражение ORM: базовая единица для единицы измерения field."""
+    return Case(
+        *(When(**{field: unit}, then=Value(base))
+          for unit, (base, factor) in UNIT_CONVERSIONS.items()),
+        default=F(field))
+
+
+def unit_factor(field):
+    """Выражение ORM: число базовых единиц в единице измерения field."""
+    return Case(
+        *(When(**{field: unit}, then=Value(factor))
+          for unit, (base, factor) in UNIT_CONVERSIONS.items()
+          if factor != 1),
+        default=Value(1),
+        output_field=IntegerField())
+
+
+def humanize(unit, amount):
+    """Переводит количество в базовой единице unit в наиболее крупную
+    подходящую единицу. Возвращает (единица, количество)."""
+    for larger, (base, factor) in sorted(
+            UNIT_CONVERSIONS.items(), key=lambda item: -item[1][1]):
+        if base != unit or factor == 1 or amount < factor:
+            continue
+        if larger in FRACTIONAL_UNITS:
+            return larger, f'{amount / factor:.3f}'.rstrip('0').rstrip('.')
+        if amount % factor == 0:
+            return larger, str(amount // factor)
+    return unit, str(amount)
@@ -1,17 +1,54 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from recipes.admin import CounterAdminMixin
+from recipes.counters import recount
+from recipes.models import Favorite, Shopping
 from rest_framework.authtoken.models import TokenProxy
 from users.models import Subscription, User
 
+# Связи пользователя, удаляемые каскадом вместе с ним, и счетчики
+# связанных объектов, которые после этого нужно пересчитать.
+USER_RELATIONS = (
+    (Favorite, 'recipe', 'favorites_count'),
+    (Shopping, 'recipe', 'shopping_count'),
+    (Subscription, 'author', 'followers_count'),
+)
+
 
 class CustomUserAdmin(UserAdmin):
     model = User
     list_display = ('email', 'username',)
     list_filter = ('email', 'username',)
 
+    def delete_model(self, request, obj):
+        targets = self.relation_targets([obj.pk])
+        super().delete_model(request, obj)
+        self.recount(targets)
+
+    def delete_queryset(self, request, queryset):
+        targets = self.relation_targets(queryset)
+        super().delete_queryset(request, queryset)
+        self.recount(targets)
+
+    def relation_targets(self, users):
+        """Рецепты и авторы, с которыми связаны избранное, покупки
+        и подписки удаляемых пользователей."""
+        return [
+            (model, field, counter, set(model.objects.filter(
+                user__in=users).values_list(field, flat=True)))
+            for model, field, counter in USER_RELATIONS]
+
+    def recount(self, targets):
+        for model, field, counter, pks in targets:
+            recount(model, field, counter, pks)
+
+
+class SubscriptionAdmin(CounterAdminMixin, admin.ModelAdmin):
+    counters = (('author', 'followers_count'),)
+
 
 TokenProxy._meta.verbose_name = 'Токен'
 TokenProxy._meta.verbose_name_plural = 'Токены'
 
 admin.site.register(User, CustomUserAdmin)
-admin.site.register(Subscription)
+admin.site.register(Subscription, SubscriptionAdmin)
@@ -23,7 +23,9 @@ def validate_username(value):
 
 
 class User(AbstractUser):
-    """Модель User."""
+    """Модель User.
+    Счетчики recipes_count и followers_count обновляются вьюсетами
+    и админкой и пересчитываются командой reconcile_counters."""
     email = models.EmailField(
         unique=True,
         blank=False,
@@ -47,6 +49,16 @@ class User(AbstractUser):
         blank=False,
         verbose_name='Фамилия'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
 
     class Meta:
         ordering = ('username',)
@@ -85,6 +97,10 @@ class Subscription(models.Model):
                 name='user_not_author'
             )
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='subscription_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} {self.author}'